@@ -1,17 +1,29 @@
+import copy
+import time
+
+# Measured from the first line of the module so cold-start time includes imports
+STARTUP_BEGAN = time.perf_counter()
+
 import os
 import logging
+import threading
 from flask import Flask, Response, jsonify, request
 from dotenv import load_dotenv
-from email_fetcher import fetch_emails_since, get_latest_uid
-from summarizer import summarize_email
-from persistence import init_db, insert_summary, fetch_all_summaries, get_db_path
-from feedgen.feed import FeedGenerator
-from apscheduler.schedulers.background import BackgroundScheduler
-from imapclient import IMAPClient
+from email_fetcher import fetch_pending_headers, iter_emails, get_latest_uid
+from summarizer import summarize_email, get_prompt_version, is_error_result, OLLAMA_MODEL
+from message_store import get_message_store
+from ollama_pool import get_pool
+from retention import run_retention, get_db_size_report
+from near_duplicates import init_near_duplicate_index, prune_near_duplicate_index, get_near_duplicate_stats
+from feed_publisher import publish_feed, STATIC_FEED_DIR, STATIC_FEED_BASE_URL
+from priority import prioritize, priority_tier, UidCheckpoint, PRIORITY_ORDER
+from persistence import (init_db, insert_summary, insert_summary_version, fetch_all_summaries, get_db_path, get_summaries_version,
+                         record_failed_attempt, clear_failed_attempts, get_finished_uids)
 import requests
 import sqlite3
 from datetime import datetime, timedelta, timezone
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
@@ -24,6 +36,38 @@ app = Flask(__name__)
 
 # Configuration
 LAST_UID_FILE = 'last_uid.txt'  # Simplified - just use current directory
+# Failed attempts after which an email is given up on, so it can't hold last_uid.txt back forever
+MAX_EMAIL_ATTEMPTS = max(1, int(os.getenv('MAX_EMAIL_ATTEMPTS', '5')))
+
+# Cold-start timings in seconds, reported by /status
+startup_metrics = {'import_seconds': round(time.perf_counter() - STARTUP_BEGAN, 3)}
+
+# Prevents the startup catch-up run and the scheduled job from processing the same emails concurrently
+process_lock = threading.Lock()
+
+# Set whenever the static feed may be stale; only the publisher thread renders and writes it,
+# so workers never wait on a publish and a burst of stored summaries becomes a single publish
+publish_requested = threading.Event()
+# Summaries version last written to STATIC_FEED_DIR, so runs without changes don't rewrite the files
+published_version = None
+
+# Per-run stats and time from discovery to feed visibility per priority tier, reported by /status
+ingestion_metrics = {'last_run': None, 'time_to_feed': {}}
+metrics_lock = threading.Lock()
+
+# Rendered feed per base URL, keyed on the summaries table version: {base_url: (version, content)}.
+# The base URL comes from the client's Host header, so only the most recently used few are kept.
+FEED_CACHE_MAX_ENTRIES = 4
+feed_cache = OrderedDict()
+feed_cache_lock = threading.Lock()
+
+
+def get_ollama_concurrency():
+    """Number of emails summarized in parallel; defaults to one per Ollama host."""
+    configured = os.getenv('OLLAMA_CONCURRENCY')
+    if configured:
+        return max(1, int(configured))
+    return max(1, len(get_pool()))
 
 
 def read_last_uid():
@@ -77,44 +121,135 @@ def initialize_last_uid():
             logger.info('No emails found to initialize last_uid.txt.')
 
 
+def process_single_email(email):
+    """Returns True if a summary was stored, False if the email isn't important, None if it failed and should be retried."""
+    uid = email['uid']
+    subject = email['subject']
+    from_name = email['from_name']
+    date = email['date']
+    body = email['body']
+    logger.info(f'Processing email UID {uid}: {subject}')
+    try:
+        result = summarize_email(subject, from_name, date, body)
+        logger.info(f'Summarizer result for UID {uid}: {result}')
+        if is_error_result(result):
+            # Not a verdict: keep it out of summary_versions and leave the email to be retried
+            logger.error(f'Could not classify email UID {uid}: {result["reason"]}')
+            return None
+        insert_summary_version(uid, get_prompt_version(), OLLAMA_MODEL, result)
+        if result['is_important']:
+            insert_summary(uid, subject, from_name, date, result['summary'], result.get('ai_summary'))
+            logger.info(f'Stored summary for UID {uid}')
+            return True
+        else:
+            logger.info(f'Email UID {uid} not important, skipping.')
+            return False
+    except Exception as e:
+        logger.error(f'Error summarizing/storing email UID {uid}: {e}')
+        return None
+
+
+def record_time_to_feed(tier, seconds):
+    with metrics_lock:
+        stats = ingestion_metrics['time_to_feed'].setdefault(tier, {'count': 0, 'avg_seconds': 0.0, 'max_seconds': 0.0, 'last_seconds': None})
+        stats['count'] += 1
+        stats['avg_seconds'] = round(stats['avg_seconds'] + (seconds - stats['avg_seconds']) / stats['count'], 3)
+        stats['max_seconds'] = round(max(stats['max_seconds'], seconds), 3)
+        stats['last_seconds'] = round(seconds, 3)
+
+
 def process_emails():
+    if not process_lock.acquire(blocking=False):
+        logger.info('Email processing already running, skipping this run.')
+        return
+    try:
+        _process_emails()
+        request_static_publish()
+    finally:
+        process_lock.release()
+
+
+def _process_emails():
     logger.info('Starting email processing...')
     last_uid = read_last_uid()
     logger.info(f'Last processed UID: {last_uid}')
+    run_started = time.perf_counter()
     try:
-        emails = fetch_emails_since(last_uid)
-        logger.info(f'Fetched {len(emails)} new emails.')
-        if emails:
-            logger.info(f'Email UIDs to process: {[email["uid"] for email in emails]}')
+        pending = fetch_pending_headers(last_uid)
+        logger.info(f'Found {len(pending)} new emails.')
     except Exception as e:
         logger.error(f'Error fetching emails: {e}')
         return
-    max_uid = last_uid or 0
-    for email in emails:
+    if not pending:
+        logger.info(f'No new emails processed, keeping last UID at {last_uid}')
+        return
+
+    # Highest priority first; bodies are downloaded and summarized in this order
+    ordered = prioritize(pending)
+    tiers = {email['uid']: priority_tier(email) for email in ordered}
+    logger.info(f'Email UIDs to process ({",".join(PRIORITY_ORDER)} order): {[email["uid"] for email in ordered]}')
+
+    # Work finishes out of order, so last_uid.txt only advances past UIDs with no unfinished lower UID
+    checkpoint = UidCheckpoint(last_uid or 0, [email['uid'] for email in ordered], write_last_uid)
+    stored_count = 0
+
+    # A failed lower UID holds the checkpoint back, so UIDs above it that an earlier run already finished
+    # come back here; skip them rather than fetching and classifying them again
+    finished = get_finished_uids(last_uid or 0, get_prompt_version(), OLLAMA_MODEL, MAX_EMAIL_ATTEMPTS)
+    skipped = [email['uid'] for email in ordered if email['uid'] in finished]
+    if skipped:
+        for uid in skipped:
+            checkpoint.mark_done(uid)
+        ordered = [email for email in ordered if email['uid'] not in finished]
+        logger.info(f'Skipping {len(skipped)} UIDs finished in an earlier run, {len(ordered)} left to process')
+
+    def handle(email):
+        nonlocal stored_count
         uid = email['uid']
-        subject = email['subject']
-        from_name = email['from_name']
-        date = email['date']
-        body = email['body']
-        logger.info(f'Processing email UID {uid}: {subject}')
+        stored = process_single_email(email)
+        if stored is None:
+            attempts = record_failed_attempt(uid)
+            if attempts < MAX_EMAIL_ATTEMPTS:
+                # Left unmarked so the checkpoint stays below it and the next run retries it
+                logger.warning(f'Email UID {uid} failed (attempt {attempts} of {MAX_EMAIL_ATTEMPTS}), it will be retried on the next run')
+                return
+            logger.error(f'Giving up on email UID {uid} after {attempts} failed attempts: '
+                         f'"{email["subject"]}" from {email["from_name"]} ({email["date"]})')
+            checkpoint.mark_done(uid)
+            return
+        clear_failed_attempts(uid)
+        if stored:
+            # The summary is already committed, so /rss serves it now; have the static copy refreshed too
+            request_static_publish()
+            record_time_to_feed(tiers[uid], time.perf_counter() - run_started)
+            with metrics_lock:
+                stored_count += 1
+        checkpoint.mark_done(uid)
+
+    workers = get_ollama_concurrency()
+    logger.info(f'Summarizing with {workers} parallel worker(s)')
+    futures = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
         try:
-            result = summarize_email(subject, from_name, date, body)
-            logger.info(f'Summarizer result for UID {uid}: {result}')
-            if result['is_important']:
-                insert_summary(uid, subject, from_name, date, result['summary'], result.get('ai_summary'))
-                logger.info(f'Stored summary for UID {uid}')
-            else:
-                logger.info(f'Email UID {uid} not important, skipping.')
+            for email in iter_emails([email['uid'] for email in ordered], message_store=get_message_store()):
+                futures[executor.submit(handle, email)] = email['uid']
         except Exception as e:
-            logger.error(f'Error summarizing/storing email UID {uid}: {e}')
-        if uid > max_uid:
-            max_uid = uid
-    if max_uid != (last_uid or 0):
-        logger.info(f'Updating last UID from {last_uid} to {max_uid}')
-        write_last_uid(max_uid)
-    else:
-        logger.info(f'No new emails processed, keeping last UID at {last_uid}')
-    logger.info('Email processing complete.')
+            # Anything not fetched stays above the checkpoint and is retried next run
+            logger.error(f'Error fetching emails: {e}')
+    for future, uid in futures.items():
+        # An exception in handle (e.g. writing last_uid.txt) would otherwise vanish with the future
+        if future.exception() is not None:
+            logger.error(f'Error handling email UID {uid}: {future.exception()}')
+
+    with metrics_lock:
+        ingestion_metrics['last_run'] = {
+            'finished_at': datetime.now(timezone.utc).isoformat(),
+            'duration_seconds': round(time.perf_counter() - run_started, 3),
+            'pending': len(ordered),
+            'stored': stored_count,
+            'last_uid': checkpoint.uid,
+        }
+    logger.info(f'Email processing complete. Last UID is now {checkpoint.uid}.')
 
 
 def parse_summary_text(raw_summary):
@@ -179,12 +314,16 @@ def get_last_n_day_summaries(n=30):
     return [(day, grouped[day]) for day in sorted_days]
 
 
-@app.route('/rss')
-def rss_feed():
-    from flask import request
+def render_feed(base_url):
+    """Render the RSS feed, reusing the last rendering until the summaries table changes."""
+    version = get_summaries_version()
+    with feed_cache_lock:
+        cached = feed_cache.get(base_url)
+        if cached and cached[0] == version:
+            feed_cache.move_to_end(base_url)
+            return cached[1]
 
-    # Get the base URL from the request
-    base_url = request.url_root.rstrip('/')
+    from feedgen.feed import FeedGenerator  # Deferred: only needed once a feed is rendered
 
     fg = FeedGenerator()
     fg.title('Important Emails Digest')
@@ -208,7 +347,7 @@ def rss_feed():
         fe.description('No important emails have been processed yet. Check back later.')
         fe.link(href=f'{base_url}/status')
         fe.author({'name': os.getenv('USER_NAME', 'Email Summarizer'), 'email': 'noreply@localhost'})
-        fe.pubDate(datetime.now(timezone.utc))
+        # No pubDate: a render-time date would make every rendering differ and defeat unchanged-feed detection
 
     for day, summaries in digests:
         if not summaries:
@@ -233,7 +372,46 @@ def rss_feed():
         fe.pubDate(datetime.combine(day, datetime.min.time(), tzinfo=timezone.utc))
 
     rss_content = fg.rss_str(pretty=True)
-    return Response(rss_content, mimetype='application/rss+xml')
+    with feed_cache_lock:
+        feed_cache[base_url] = (version, rss_content)
+        feed_cache.move_to_end(base_url)
+        while len(feed_cache) > FEED_CACHE_MAX_ENTRIES:
+            feed_cache.popitem(last=False)
+    return rss_content
+
+
+def publish_static_feed():
+    """Write the feed to STATIC_FEED_DIR for a static file server. Only called from the publisher thread."""
+    global published_version
+    try:
+        version = get_summaries_version()
+        if version == published_version:
+            return
+        publish_feed(render_feed(STATIC_FEED_BASE_URL), STATIC_FEED_DIR)
+        published_version = version
+    except Exception as e:
+        logger.error(f'Failed to publish static feed to {STATIC_FEED_DIR}: {e}')
+
+
+def request_static_publish():
+    """Ask the publisher thread to refresh the static feed, if static publishing is enabled."""
+    if STATIC_FEED_DIR:
+        publish_requested.set()
+
+
+def static_feed_publisher():
+    """Publish the static feed whenever requested; requests made during a publish are merged into the next one."""
+    while True:
+        publish_requested.wait()
+        publish_requested.clear()
+        publish_static_feed()
+
+
+@app.route('/rss')
+def rss_feed():
+    # Get the base URL from the request
+    base_url = request.url_root.rstrip('/')
+    return Response(render_feed(base_url), mimetype='application/rss+xml')
 
 
 @app.route('/status')
@@ -241,11 +419,17 @@ def status_check():
     # Check if we should do a full LLM test (add ?test_llm=true to URL)
     test_llm = request.args.get('test_llm', 'false').lower() == 'true'
 
-    status = {'imap': 'ok', 'ollama': 'ok', 'sqlite': 'ok', 'overall': 'ok'}
+    # Copies, since background threads keep updating the metrics while the response is serialized
+    with metrics_lock:
+        startup = copy.deepcopy(startup_metrics)
+        ingestion = copy.deepcopy(ingestion_metrics)
+    status = {'imap': 'ok', 'ollama': 'ok', 'sqlite': 'ok', 'overall': 'ok', 'startup': startup,
+              'near_duplicates': get_near_duplicate_stats(), 'ingestion': ingestion}
 
     # IMAP: check and count emails, list folders
     try:
         logger.info('Checking IMAP connection...')
+        from imapclient import IMAPClient  # Deferred: keeps it out of the startup path
         with IMAPClient(os.getenv('IMAP_HOST'), port=int(os.getenv('IMAP_PORT', 993)), ssl=True) as server:
             server.login(os.getenv('IMAP_USER'), os.getenv('IMAP_PASSWORD'))
             folders = server.list_folders()
@@ -262,29 +446,42 @@ def status_check():
         status['overall'] = 'error'
         logger.error(f'IMAP check failed: {e}')
 
-    # Ollama: lightweight check or full test
+    # Ollama: lightweight check of every pool host, or full test through the pool
     try:
         logger.info('Checking Ollama connection...')
-        ollama_url = os.getenv('OLLAMA_API_URL')
+        pool = get_pool()
         ollama_model = os.getenv('OLLAMA_MODEL', 'llama3')
-        ollama_timeout = int(os.getenv('OLLAMA_TIMEOUT', '60'))
 
         if test_llm:
-            # Full test with LLM call
+            # Full test with LLM call on every host; probes bypass the circuit breakers so a slow
+            # test doesn't take a healthy host away from ingestion
             test_prompt = "Test"
-            resp = requests.post(ollama_url, json={"model": ollama_model, "prompt": test_prompt, "stream": False}, timeout=5)
-            resp.raise_for_status()
-            data = resp.json()
-            status['ollama'] = {'status': 'ok', 'test_response': data.get('response', '').strip()[:100]}
+            ollama_timeout = int(os.getenv('OLLAMA_TIMEOUT', '60'))
+            results = pool.probe({"model": ollama_model, "prompt": test_prompt, "stream": False}, timeout=ollama_timeout)
+            hosts = pool.snapshot()
+            for host in hosts:
+                host.update(results[host['url']])
+            if not hosts or all(result['status'] != 'ok' for result in results.values()):
+                raise Exception(f"No Ollama host passed the LLM test: {results}")
+            status['ollama'] = {'status': 'ok', 'hosts': hosts}
             logger.info('Ollama LLM test OK.')
         else:
-            # Lightweight check - just verify the API endpoint responds
-            resp = requests.get(ollama_url.replace('/api/generate', '/'), timeout=5)
-            if resp.status_code in [200, 404]:  # 404 is normal for Ollama root
-                status['ollama'] = {'status': 'ok', 'note': 'Lightweight check - add ?test_llm=true for full test'}
-                logger.info('Ollama connection OK (lightweight check).')
-            else:
-                raise Exception(f"Unexpected status code: {resp.status_code}")
+            # Lightweight check - just verify each API endpoint responds
+            reachable = {}
+            for host in pool.hosts:
+                try:
+                    resp = requests.get(host.url.replace('/api/generate', '/'), timeout=5)
+                    # 404 is normal for Ollama root
+                    reachable[host.url] = 'ok' if resp.status_code in [200, 404] else f'unexpected status code: {resp.status_code}'
+                except Exception as e:
+                    reachable[host.url] = f'error: {e}'
+            hosts = pool.snapshot()
+            for host in hosts:
+                host['reachable'] = reachable[host['url']]
+            if not hosts or all(value != 'ok' for value in reachable.values()):
+                raise Exception(f"No reachable Ollama hosts: {reachable}")
+            status['ollama'] = {'status': 'ok', 'hosts': hosts, 'note': 'Lightweight check - add ?test_llm=true for full test'}
+            logger.info(f'Ollama connection OK (lightweight check): {reachable}')
     except Exception as e:
         status['ollama'] = {'status': f'error: {e}', 'test_response': None}
         status['overall'] = 'error'
@@ -298,7 +495,7 @@ def status_check():
         c.execute('SELECT COUNT(*) FROM summaries')
         count = c.fetchone()[0]
         conn.close()
-        status['sqlite'] = {'status': 'ok', 'summary_count': count}
+        status['sqlite'] = {'status': 'ok', 'summary_count': count, 'size': get_db_size_report()}
         logger.info(f'SQLite connection OK. Summary count: {count}')
     except Exception as e:
         status['sqlite'] = {'status': f'error: {e}', 'summary_count': None}
@@ -308,27 +505,80 @@ def status_check():
     return jsonify(status)
 
 
+def retention_job():
+    run_retention()
+    try:
+        prune_near_duplicate_index()
+    except Exception as e:
+        logger.error(f'Failed to prune near-duplicate index: {e}')
+    # Archiving can drop days from the feed, so republish the static copy
+    request_static_publish()
+
+
 def start_scheduler():
+    from apscheduler.schedulers.background import BackgroundScheduler  # Deferred: keeps it out of the startup path
+
     scheduler = BackgroundScheduler()
     # Run process_emails every day at 6am server time
     scheduler.add_job(process_emails, 'cron', hour=6, minute=0, id='email_job', replace_existing=True)
+    # Archive old summaries and reclaim space once a day, away from the email job
+    retention_hour = int(os.getenv('RETENTION_HOUR', 3))
+    scheduler.add_job(retention_job, 'cron', hour=retention_hour, minute=0, id='retention_job', replace_existing=True)
     scheduler.start()
-    logger.info('Background scheduler started. Email job scheduled for 6am daily.')
+    logger.info(f'Background scheduler started. Email job scheduled for 6am daily, retention job at {retention_hour}:00.')
+
+
+def warm_up_model():
+    """Load the model on every Ollama host so the first summaries don't wait for it."""
+    start = time.perf_counter()
+    model = os.getenv('OLLAMA_MODEL', 'llama3')
+    logger.info(f'Preloading model {model} on Ollama hosts...')
+    hosts = get_pool().warm_up(model, timeout=int(os.getenv('OLLAMA_TIMEOUT', '60')))
+    with metrics_lock:
+        startup_metrics['warm_up_hosts'] = hosts
+        startup_metrics['warm_up_seconds'] = round(time.perf_counter() - start, 3)
+
+
+def catch_up():
+    """Initialize last_uid.txt if needed and process emails that arrived while the app was down."""
+    start = time.perf_counter()
+    try:
+        initialize_last_uid()
+        process_emails()
+    except Exception as e:
+        logger.error(f'Startup catch-up failed: {e}')
+    elapsed = round(time.perf_counter() - start, 3)
+    with metrics_lock:
+        startup_metrics['catch_up_seconds'] = elapsed
+    logger.info(f'Startup catch-up finished in {elapsed}s')
+
+
+def start_background_startup():
+    """Run the model warm-up, the catch-up run and the static feed publisher off the main thread so the web server binds immediately."""
+    if STATIC_FEED_DIR:
+        threading.Thread(target=static_feed_publisher, name='static-feed-publisher', daemon=True).start()
+        # Make sure the static feed exists before the first ingestion run finishes
+        request_static_publish()
+    threading.Thread(target=warm_up_model, name='model-warm-up', daemon=True).start()
+    threading.Thread(target=catch_up, name='startup-catch-up', daemon=True).start()
 
 
 if __name__ == '__main__':
     logger.info('Starting app...')
     # Initialize the database
     init_db()
+    init_near_duplicate_index()
     logger.info('Database initialized.')
-    # Initialize last_uid.txt if needed
-    initialize_last_uid()
-    # Process new emails and store summaries on startup
-    process_emails()
+    # Catch up on new emails and preload the model in the background
+    start_background_startup()
     # Start the background scheduler
     start_scheduler()
     # Start the web server
     host = os.getenv('FLASK_HOST', '0.0.0.0')
     port = int(os.getenv('FLASK_PORT', 5000))
+    ready_seconds = round(time.perf_counter() - STARTUP_BEGAN, 3)
+    with metrics_lock:
+        startup_metrics['ready_seconds'] = ready_seconds
+    logger.info(f'Startup took {ready_seconds}s (imports {startup_metrics["import_seconds"]}s)')
     logger.info(f'Web server starting on {host}:{port}')
-    app.run(host=host, port=port)
\ No newline at end of file
+    app.run(host=host, port=port)
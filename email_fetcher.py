@@ -1,5 +1,4 @@
 import os
-from imapclient import IMAPClient
 import email
 from email.header import decode_header
 from dotenv import load_dotenv
@@ -7,9 +6,12 @@ from typing import List, Dict, Optional
 from email.utils import parseaddr
 import re
 import html
+import logging
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 IMAP_HOST = os.getenv('IMAP_HOST')
 IMAP_PORT = int(os.getenv('IMAP_PORT', 993))
 IMAP_USER = os.getenv('IMAP_USER')
@@ -95,105 +97,177 @@ def decode_mime_words(s):
     ])
 
 
-def fetch_emails_since(last_uid: Optional[int] = None) -> List[Dict]:
+def parse_message(uid: int, raw_msg: bytes) -> Dict:
     """
-    Fetch emails from the IMAP server since the given UID.
-    Returns a list of dicts with keys: subject, from_name, from_addr, date, body, uid
+    Parse a raw RFC822 message into the dict used by the rest of the app.
+    Returns a dict with keys: subject, from_name, from_addr, date, body, uid
     """
-    emails = []
-    with IMAPClient(IMAP_HOST, port=IMAP_PORT, ssl=True) as server:
-        server.login(IMAP_USER, IMAP_PASSWORD)
-        server.select_folder('INBOX')
-        if last_uid:
-            # Fetch emails with UID strictly greater than last_uid
-            messages = server.search([u'UID', f'{last_uid + 1}:*'])
-            # Filter out any emails with UID <= last_uid (just to be safe)
-            messages = [uid for uid in messages if uid > last_uid]
-        else:
-            # Safety check: if no last_uid, only fetch recent emails (last 100)
-            # to prevent processing thousands of old emails
-            all_messages = server.search(['ALL'])
-            if all_messages:
-                # Take only the last 100 emails as a safety measure
-                messages = sorted(all_messages)[-100:]
-                print(f"DEBUG: No last_uid provided, limiting to last 100 emails: {len(messages)} total")
-            else:
-                messages = []
-
-        # Log what we're fetching for debugging
-        if last_uid:
-            print(f"DEBUG: Fetching emails with UID > {last_uid}, found UIDs: {messages}")
-        else:
-            print(f"DEBUG: Fetching recent emails (safety limit), found {len(messages)} UIDs")
-
-        for uid in messages:
-            raw_msg = server.fetch([uid], ['RFC822'])[uid][b'RFC822']
-            msg = email.message_from_bytes(raw_msg)
-
-            subject = decode_mime_words(msg.get('Subject', ''))
-            from_ = decode_mime_words(msg.get('From', ''))
-            date = msg.get('Date', '')
-            # Parse sender name and email
-            name, email_addr = parseaddr(from_)
-            from_name = name if name else email_addr
-            # Get body (plain text preferred, but strip HTML if needed)
-            body = ''
-            if msg.is_multipart():
-                # Try to find plain text part first
-                for part in msg.walk():
-                    if part.get_content_type() == 'text/plain' and not part.get('Content-Disposition'):
-                        charset = part.get_content_charset() or 'utf-8'
-                        raw_payload = part.get_payload(decode=True)
-                        # Limit raw payload size before decoding to prevent memory issues
-                        if len(raw_payload) > 50000:  # 50KB limit for raw content
-                            raw_payload = raw_payload[:50000]
-                        body = raw_payload.decode(charset, errors='replace')
-                        break
-
-                # If no plain text found, look for HTML and strip it
-                if not body:
-                    for part in msg.walk():
-                        if part.get_content_type() == 'text/html' and not part.get('Content-Disposition'):
-                            charset = part.get_content_charset() or 'utf-8'
-                            raw_payload = part.get_payload(decode=True)
-                            # Limit raw payload size before decoding to prevent memory issues
-                            if len(raw_payload) > 50000:  # 50KB limit for raw content
-                                raw_payload = raw_payload[:50000]
-                            html_body = raw_payload.decode(charset, errors='replace')
-                            body = strip_html(html_body)
-                            break
-            else:
-                charset = msg.get_content_charset() or 'utf-8'
-                raw_payload = msg.get_payload(decode=True)
+    msg = email.message_from_bytes(raw_msg)
+
+    subject = decode_mime_words(msg.get('Subject', ''))
+    from_ = decode_mime_words(msg.get('From', ''))
+    date = msg.get('Date', '')
+    # Parse sender name and email
+    name, email_addr = parseaddr(from_)
+    from_name = name if name else email_addr
+    # Get body (plain text preferred, but strip HTML if needed)
+    body = ''
+    if msg.is_multipart():
+        # Try to find plain text part first
+        for part in msg.walk():
+            if part.get_content_type() == 'text/plain' and not part.get('Content-Disposition'):
+                charset = part.get_content_charset() or 'utf-8'
+                raw_payload = part.get_payload(decode=True)
                 # Limit raw payload size before decoding to prevent memory issues
                 if len(raw_payload) > 50000:  # 50KB limit for raw content
                     raw_payload = raw_payload[:50000]
-                raw_body = raw_payload.decode(charset, errors='replace')
+                body = raw_payload.decode(charset, errors='replace')
+                break
+
+        # If no plain text found, look for HTML and strip it
+        if not body:
+            for part in msg.walk():
+                if part.get_content_type() == 'text/html' and not part.get('Content-Disposition'):
+                    charset = part.get_content_charset() or 'utf-8'
+                    raw_payload = part.get_payload(decode=True)
+                    # Limit raw payload size before decoding to prevent memory issues
+                    if len(raw_payload) > 50000:  # 50KB limit for raw content
+                        raw_payload = raw_payload[:50000]
+                    html_body = raw_payload.decode(charset, errors='replace')
+                    body = strip_html(html_body)
+                    break
+    else:
+        charset = msg.get_content_charset() or 'utf-8'
+        raw_payload = msg.get_payload(decode=True)
+        # Limit raw payload size before decoding to prevent memory issues
+        if len(raw_payload) > 50000:  # 50KB limit for raw content
+            raw_payload = raw_payload[:50000]
+        raw_body = raw_payload.decode(charset, errors='replace')
+
+        # Check if it's HTML content and strip if needed
+        if msg.get_content_type() == 'text/html':
+            body = strip_html(raw_body)
+        else:
+            body = raw_body
+
+    # Always limit the final body length to prevent overwhelming the LLM
+    body = limit_text_length(body)
+
+    return {
+        'uid': uid,
+        'subject': subject,
+        'from_name': from_name,
+        'from_addr': email_addr,
+        'date': date,
+        'body': body,
+    }
+
+
+HEADER_FIELDS = 'BODY.PEEK[HEADER.FIELDS (FROM SUBJECT DATE)]'
+
+
+def _header_bytes(data: Dict) -> bytes:
+    """
+    Find the header section in a FETCH response. Servers may quote or reorder the field names
+    they echo back, so the key is matched on its BODY[HEADER prefix rather than exactly.
+    """
+    for key, value in data.items():
+        if isinstance(key, bytes) and key.upper().startswith(b'BODY[HEADER'):
+            return value or b''
+    return b''
+
 
-                # Check if it's HTML content and strip if needed
-                if msg.get_content_type() == 'text/html':
-                    body = strip_html(raw_body)
-                else:
-                    body = raw_body
+def _search_pending(server, last_uid: Optional[int]) -> List[int]:
+    """Find the UIDs that still need processing, in ascending order."""
+    if last_uid:
+        # Fetch emails with UID strictly greater than last_uid
+        messages = server.search([u'UID', f'{last_uid + 1}:*'])
+        # Filter out any emails with UID <= last_uid (just to be safe)
+        messages = [uid for uid in messages if uid > last_uid]
+    else:
+        # Safety check: if no last_uid, only fetch recent emails (last 100)
+        # to prevent processing thousands of old emails
+        all_messages = server.search(['ALL'])
+        if all_messages:
+            # Take only the last 100 emails as a safety measure
+            messages = sorted(all_messages)[-100:]
+            print(f"DEBUG: No last_uid provided, limiting to last 100 emails: {len(messages)} total")
+        else:
+            messages = []
+
+    # Log what we're fetching for debugging
+    if last_uid:
+        print(f"DEBUG: Fetching emails with UID > {last_uid}, found UIDs: {messages}")
+    else:
+        print(f"DEBUG: Fetching recent emails (safety limit), found {len(messages)} UIDs")
+    return sorted(messages)
+
+
+def _fetch_message(server, uid: int, message_store=None, uidvalidity: Optional[int] = None) -> Dict:
+    raw_msg = server.fetch([uid], ['RFC822'])[uid][b'RFC822']
+    if message_store is not None:
+        try:
+            message_store.append(uid, raw_msg, uidvalidity)
+        except Exception as e:
+            # The local copy is best-effort; never lose the fetch over it
+            logger.error(f'Failed to store raw message UID {uid}: {e}')
+    return parse_message(uid, raw_msg)
+
+
+def fetch_pending_headers(last_uid: Optional[int] = None, batch_size: int = 500) -> List[Dict]:
+    """
+    Fetch only the headers of emails since the given UID, so pending work can be ordered
+    before any bodies are downloaded.
+    Returns a list of dicts with keys: subject, from_name, from_addr, date, uid
+    """
+    from imapclient import IMAPClient  # Deferred: only needed when a fetch actually runs
 
-            # Always limit the final body length to prevent overwhelming the LLM
-            body = limit_text_length(body)
+    headers = []
+    with IMAPClient(IMAP_HOST, port=IMAP_PORT, ssl=True) as server:
+        server.login(IMAP_USER, IMAP_PASSWORD)
+        server.select_folder('INBOX')
+        messages = _search_pending(server, last_uid)
+        for i in range(0, len(messages), batch_size):
+            response = server.fetch(messages[i:i + batch_size], [HEADER_FIELDS])
+            for uid, data in response.items():
+                header = _header_bytes(data)
+                if not header:
+                    # Still listed, so it is processed (its full message is fetched later), just without a priority
+                    logger.warning(f'No header section in FETCH response for UID {uid}: {list(data.keys())}')
+                msg = email.message_from_bytes(header)
+                name, email_addr = parseaddr(decode_mime_words(msg.get('From', '')))
+                headers.append({
+                    'uid': uid,
+                    'subject': decode_mime_words(msg.get('Subject', '')),
+                    'from_name': name if name else email_addr,
+                    'from_addr': email_addr,
+                    'date': msg.get('Date', ''),
+                })
+    return headers
+
+
+def iter_emails(uids: List[int], message_store=None):
+    """
+    Fetch and parse full emails one at a time, in the order given, over a single connection.
+    If a message_store is given, each raw message is also appended to it.
+    """
+    from imapclient import IMAPClient  # Deferred: only needed when a fetch actually runs
 
-            emails.append({
-                'uid': uid,
-                'subject': subject,
-                'from_name': from_name,
-                'from_addr': email_addr,
-                'date': date,
-                'body': body,
-            })
-    return emails
+    with IMAPClient(IMAP_HOST, port=IMAP_PORT, ssl=True) as server:
+        server.login(IMAP_USER, IMAP_PASSWORD)
+        folder = server.select_folder('INBOX')
+        # Stored messages are keyed on UIDVALIDITY too, since a reset mailbox reuses UIDs
+        uidvalidity = folder.get(b'UIDVALIDITY')
+        for uid in uids:
+            yield _fetch_message(server, uid, message_store, uidvalidity)
 
 
 def get_latest_uid() -> Optional[int]:
     """
     Get the highest UID in the INBOX.
     """
+    from imapclient import IMAPClient  # Deferred: only needed when a fetch actually runs
+
     with IMAPClient(IMAP_HOST, port=IMAP_PORT, ssl=True) as server:
         server.login(IMAP_USER, IMAP_PASSWORD)
         server.select_folder('INBOX')
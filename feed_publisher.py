@@ -0,0 +1,92 @@
+import os
+import re
+import gzip
+import time
+import tempfile
+import logging
+from typing import Dict, Optional
+
+from dotenv import load_dotenv
+
+try:
+    import brotli
+except ImportError:  # Optional: without it only rss.xml and rss.xml.gz are published
+    brotli = None
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Directory the static feed is published to; static publishing is disabled when unset
+STATIC_FEED_DIR = os.getenv('STATIC_FEED_DIR', '')
+# Public base URL used for feed links, since there is no request to take it from
+STATIC_FEED_BASE_URL = os.getenv('STATIC_FEED_BASE_URL', 'http://localhost:5000').rstrip('/')
+FEED_FILENAME = 'rss.xml'
+# Set to the render time on every render, so it is left out when comparing against the published feed
+LAST_BUILD_DATE = re.compile(rb'<lastBuildDate>[^<]*</lastBuildDate>')
+
+_warned_no_brotli = False
+
+
+def write_atomic(path: str, data: bytes, mtime: float):
+    """
+    Write data to path via a temp file in the same directory and a rename,
+    so readers only ever see the old file or the complete new one.
+    """
+    directory = os.path.dirname(path)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f'.{os.path.basename(path)}.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        # mkstemp creates files as 0600; the static server usually runs as another user
+        os.chmod(tmp_path, 0o644)
+        os.utime(tmp_path, (mtime, mtime))
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _is_published(path: str, content: bytes) -> bool:
+    """True if rss.xml already holds this content, apart from lastBuildDate, and its compressed copies exist."""
+    variant_paths = [path + '.gz'] + ([path + '.br'] if brotli is not None else [])
+    if not all(os.path.exists(p) for p in [path] + variant_paths):
+        return False
+    with open(path, 'rb') as f:
+        return LAST_BUILD_DATE.sub(b'', f.read()) == LAST_BUILD_DATE.sub(b'', content)
+
+
+def publish_feed(content: bytes, directory: str) -> Optional[Dict[str, int]]:
+    """
+    Publish the rendered feed as rss.xml plus precompressed .gz and .br copies.
+    All files share one mtime so a static server reports a consistent Last-Modified.
+    Unchanged content is not rewritten, so Last-Modified/ETag stay stable for conditional GETs.
+    Returns the size in bytes of each published file, or None if nothing changed.
+    """
+    global _warned_no_brotli
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, FEED_FILENAME)
+    if _is_published(path, content):
+        logger.info(f'Static feed in {directory} is unchanged, not republishing')
+        return None
+    mtime = time.time()
+
+    variants = {path + '.gz': gzip.compress(content, compresslevel=9, mtime=int(mtime))}
+    if brotli is not None:
+        variants[path + '.br'] = brotli.compress(content, quality=11)
+    elif not _warned_no_brotli:
+        logger.warning('brotli is not installed, skipping rss.xml.br')
+        _warned_no_brotli = True
+
+    # Compressed copies first, so a server that prefers them never serves ones older than rss.xml
+    for variant_path, data in variants.items():
+        write_atomic(variant_path, data, mtime)
+    write_atomic(path, content, mtime)
+
+    sizes = {os.path.basename(p): len(data) for p, data in variants.items()}
+    sizes[FEED_FILENAME] = len(content)
+    logger.info(f'Published static feed to {directory}: {sizes}')
+    return sizes
@@ -0,0 +1,187 @@
+import os
+import gzip
+import mmap
+import sqlite3
+import logging
+import threading
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from dotenv import load_dotenv
+
+try:
+    import zstandard
+except ImportError:  # Optional: falls back to gzip
+    zstandard = None
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+MESSAGE_STORE_ENABLED = os.getenv('MESSAGE_STORE_ENABLED', 'true').lower() == 'true'
+MESSAGE_STORE_CODEC = os.getenv('MESSAGE_STORE_CODEC', 'zstd' if zstandard is not None else 'gzip').lower()
+# A new segment file is started once the current one reaches this size
+MESSAGE_STORE_SEGMENT_BYTES = int(os.getenv('MESSAGE_STORE_SEGMENT_BYTES', str(64 * 1024 * 1024)))
+
+
+def get_message_store_dir():
+    """Get the message store directory dynamically."""
+    return os.path.join(os.getenv('DATA_DIR', '.'), 'message_store')
+
+
+def _compress(data: bytes, codec: str) -> bytes:
+    if codec == 'zstd':
+        if zstandard is None:
+            raise RuntimeError('MESSAGE_STORE_CODEC=zstd requires the zstandard package')
+        return zstandard.ZstdCompressor(level=10).compress(data)
+    return gzip.compress(data, compresslevel=6, mtime=0)
+
+
+def _decompress(data: bytes, codec: str) -> bytes:
+    if codec == 'zstd':
+        if zstandard is None:
+            raise RuntimeError('Message was stored with zstd but the zstandard package is not installed')
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+
+class MessageStore:
+    """
+    Append-only store of raw RFC822 messages.
+
+    Messages are compressed individually and appended to numbered segment files
+    (segment-000001.dat, ...). An SQLite index maps each (UIDVALIDITY, UID) pair to its segment,
+    offset and length, and reads go through memory-mapped segments. A UID is only ever written once
+    per UIDVALIDITY; reads default to the UIDVALIDITY of the most recently stored message, so a
+    mailbox whose UIDs were reset never serves an old message under a reused UID.
+    """
+
+    def __init__(self, directory: str, codec: str = MESSAGE_STORE_CODEC, segment_bytes: int = MESSAGE_STORE_SEGMENT_BYTES):
+        self.directory = directory
+        self.codec = codec
+        self.segment_bytes = segment_bytes
+        self._write_lock = threading.Lock()
+        self._maps_lock = threading.Lock()
+        self._maps = {}
+        os.makedirs(directory, exist_ok=True)
+        self.index_path = os.path.join(directory, 'index.db')
+        with sqlite3.connect(self.index_path) as conn:
+            columns = [row[1] for row in conn.execute('PRAGMA table_info(messages)')]
+            if columns and 'uidvalidity' not in columns:
+                # Indexes written before UIDVALIDITY was tracked are keyed on the bare UID; rebuild with
+                # UIDVALIDITY 0 (unknown), which the first append with a real UIDVALIDITY adopts
+                conn.execute('ALTER TABLE messages RENAME TO messages_old')
+            conn.execute('''CREATE TABLE IF NOT EXISTS messages
+                            (uidvalidity INTEGER NOT NULL, uid INTEGER NOT NULL, segment INTEGER, offset INTEGER,
+                             length INTEGER, codec TEXT, stored_at TEXT, PRIMARY KEY (uidvalidity, uid))''')
+            if columns and 'uidvalidity' not in columns:
+                conn.execute('''INSERT INTO messages (uidvalidity, uid, segment, offset, length, codec, stored_at)
+                                SELECT 0, uid, segment, offset, length, codec, stored_at FROM messages_old ORDER BY uid''')
+                conn.execute('DROP TABLE messages_old')
+            conn.commit()
+
+    def _segment_path(self, segment: int) -> str:
+        return os.path.join(self.directory, f'segment-{segment:06d}.dat')
+
+    def _current_segment(self, conn) -> int:
+        segment = conn.execute('SELECT MAX(segment) FROM messages').fetchone()[0] or 1
+        path = self._segment_path(segment)
+        if os.path.exists(path) and os.path.getsize(path) >= self.segment_bytes:
+            segment += 1
+        return segment
+
+    def _current_uidvalidity(self, conn) -> int:
+        """UIDVALIDITY of the most recently stored message (0 if unknown or the store is empty)."""
+        row = conn.execute('SELECT uidvalidity FROM messages ORDER BY rowid DESC LIMIT 1').fetchone()
+        return row[0] if row else 0
+
+    def append(self, uid: int, raw_msg: bytes, uidvalidity: Optional[int] = None) -> bool:
+        """
+        Compress and append a raw message. uidvalidity is the mailbox's UIDVALIDITY when the UID was fetched.
+        Returns False if the UID is already stored under that UIDVALIDITY.
+        """
+        with self._write_lock, sqlite3.connect(self.index_path) as conn:
+            current = self._current_uidvalidity(conn)
+            uidvalidity = uidvalidity or current
+            if uidvalidity != current:
+                if current == 0:
+                    # Messages stored before UIDVALIDITY was tracked are assumed to belong to the first one seen
+                    conn.execute('UPDATE messages SET uidvalidity = ? WHERE uidvalidity = 0', (uidvalidity,))
+                else:
+                    logger.warning(f'Mailbox UIDVALIDITY changed from {current} to {uidvalidity}; messages stored '
+                                   f'under {current} are kept but no longer returned for their UIDs')
+            if conn.execute('SELECT 1 FROM messages WHERE uidvalidity = ? AND uid = ?', (uidvalidity, uid)).fetchone():
+                return False
+            data = _compress(raw_msg, self.codec)
+            segment = self._current_segment(conn)
+            with open(self._segment_path(segment), 'ab') as f:
+                offset = f.tell()
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            # The index row is written after the data, so a crash leaves at worst unreferenced bytes
+            conn.execute('INSERT INTO messages (uidvalidity, uid, segment, offset, length, codec, stored_at) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                         (uidvalidity, uid, segment, offset, len(data), self.codec, datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S')))
+            conn.commit()
+            return True
+
+    def _map(self, segment: int, end: int) -> mmap.mmap:
+        """Memory-map a segment, remapping if it has grown past the existing mapping."""
+        with self._maps_lock:
+            mapped = self._maps.get(segment)
+            if mapped is None or len(mapped) < end:
+                # The old mapping is left for the garbage collector, another thread may still be reading it
+                with open(self._segment_path(segment), 'rb') as f:
+                    mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                self._maps[segment] = mapped
+            return mapped
+
+    def get(self, uid: int, uidvalidity: Optional[int] = None) -> Optional[bytes]:
+        """
+        Read and decompress a raw message, or None if the UID is not stored.
+        uidvalidity defaults to the current one (that of the most recently stored message).
+        """
+        with sqlite3.connect(self.index_path) as conn:
+            if uidvalidity is None:
+                uidvalidity = self._current_uidvalidity(conn)
+            row = conn.execute('SELECT segment, offset, length, codec FROM messages WHERE uidvalidity = ? AND uid = ?',
+                               (uidvalidity, uid)).fetchone()
+        if row is None:
+            return None
+        segment, offset, length, codec = row
+        mapped = self._map(segment, offset + length)
+        return _decompress(mapped[offset:offset + length], codec)
+
+    def uids(self, since_uid: Optional[int] = None, until_uid: Optional[int] = None, uidvalidity: Optional[int] = None) -> List[int]:
+        """
+        List stored UIDs in ascending order, optionally limited to an inclusive range.
+        uidvalidity defaults to the current one, as in get().
+        """
+        query = 'SELECT uid FROM messages WHERE uidvalidity = ? AND uid >= ? AND uid <= ? ORDER BY uid'
+        with sqlite3.connect(self.index_path) as conn:
+            if uidvalidity is None:
+                uidvalidity = self._current_uidvalidity(conn)
+            rows = conn.execute(query, (uidvalidity, since_uid or 0, until_uid if until_uid is not None else 2 ** 63 - 1)).fetchall()
+        return [row[0] for row in rows]
+
+    def close(self):
+        with self._maps_lock:
+            for mapped in self._maps.values():
+                mapped.close()
+            self._maps.clear()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_message_store() -> Optional[MessageStore]:
+    """Get the process-wide message store, or None if MESSAGE_STORE_ENABLED is false."""
+    global _store
+    if not MESSAGE_STORE_ENABLED:
+        return None
+    with _store_lock:
+        if _store is None:
+            _store = MessageStore(get_message_store_dir())
+            logger.info(f'Message store at {_store.directory} using {_store.codec}')
+        return _store
@@ -0,0 +1,204 @@
+import os
+import re
+import zlib
+import sqlite3
+import hashlib
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional
+
+from dotenv import load_dotenv
+from persistence import get_db_path
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+NEAR_DUP_ENABLED = os.getenv('NEAR_DUP_ENABLED', 'true').lower() == 'true'
+# Minimum estimated Jaccard similarity for an earlier verdict to be reused
+NEAR_DUP_THRESHOLD = float(os.getenv('NEAR_DUP_THRESHOLD', '0.9'))
+# Only verdicts from this many days back are considered
+NEAR_DUP_WINDOW_DAYS = int(os.getenv('NEAR_DUP_WINDOW_DAYS', '30'))
+# Important verdicts carry a summary of the earlier email, so by default those still go to the LLM
+NEAR_DUP_REUSE_IMPORTANT = os.getenv('NEAR_DUP_REUSE_IMPORTANT', 'false').lower() == 'true'
+
+SHINGLE_SIZE = 3
+NUM_PERMUTATIONS = 128
+# 16 bands of 8 rows puts the LSH candidate threshold at roughly (1/16)^(1/8) ~= 0.7
+NUM_BANDS = 16
+ROWS_PER_BAND = NUM_PERMUTATIONS // NUM_BANDS
+# Prime just above 2**32, so (a * h) with a, h < 2**32 still fits in uint64
+HASH_PRIME = 4294967311
+
+_permutations = None
+
+# Counters reported by /status
+_stats_lock = threading.Lock()
+_stats = {'lookups': 0, 'candidates': 0, 'reuses': 0, 'not_reused': 0, 'last_similarity': None}
+
+
+def _get_permutations():
+    """Fixed-seed hash coefficients; they must not change between runs or stored signatures become useless."""
+    global _permutations
+    if _permutations is None:
+        import numpy as np  # Deferred: keeps numpy out of the startup path
+        rng = np.random.default_rng(20240101)
+        a = rng.integers(1, 2 ** 32, size=(NUM_PERMUTATIONS, 1), dtype=np.uint64)
+        b = rng.integers(0, 2 ** 32, size=(NUM_PERMUTATIONS, 1), dtype=np.uint64)
+        _permutations = (a, b)
+    return _permutations
+
+
+# Whole numeric tokens: amounts ($1,234.56), dates (2024-01-31, 31/01), times (10:30), ordinals (21st)
+NUMBER_PATTERN = re.compile(r'[$€£¥]?\d[\d,.:/-]*(?:st|nd|rd|th)?')
+MONTH_PATTERN = re.compile(r'\b(?:jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may|june?|july?|aug(?:ust)?'
+                           r'|sep(?:t(?:ember)?)?|oct(?:ober)?|nov(?:ember)?|dec(?:ember)?)\b')
+WEEKDAY_PATTERN = re.compile(r'\b(?:mon(?:day)?|tue(?:s(?:day)?)?|wed(?:nesday)?|thu(?:r(?:s(?:day)?)?)?'
+                             r'|fri(?:day)?|sat(?:urday)?|sun(?:day)?)\b')
+
+
+def normalize_text(text: str) -> str:
+    """
+    Lowercase, collapse whitespace and replace numbers, month and weekday names with placeholders,
+    so amounts, order numbers and dates don't change shingles.
+    """
+    text = (text or '').lower()
+    text = NUMBER_PATTERN.sub('0', text)
+    text = MONTH_PATTERN.sub('<month>', text)
+    text = WEEKDAY_PATTERN.sub('<weekday>', text)
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+def compute_signature(subject: str, body: str):
+    """
+    MinHash signature of the word shingles of subject and body, as a uint64 NumPy array.
+    Returns None if there is no text to hash.
+    """
+    import numpy as np
+
+    words = normalize_text(f'{subject}\n{body}').split(' ')
+    words = [w for w in words if w]
+    if not words:
+        return None
+    if len(words) < SHINGLE_SIZE:
+        shingles = {' '.join(words)}
+    else:
+        shingles = {' '.join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+    hashes = np.fromiter((zlib.crc32(s.encode('utf-8')) for s in shingles), dtype=np.uint64, count=len(shingles))
+    a, b = _get_permutations()
+    # (NUM_PERMUTATIONS, n_shingles) matrix of permuted hashes, minimised per permutation
+    permuted = ((a * hashes[np.newaxis, :]) % HASH_PRIME + b) % HASH_PRIME
+    return permuted.min(axis=1)
+
+
+def _band_buckets(signature):
+    """One bucket key per LSH band, as signed 64-bit integers for SQLite."""
+    return [
+        int.from_bytes(hashlib.blake2b(signature[i * ROWS_PER_BAND:(i + 1) * ROWS_PER_BAND].tobytes(), digest_size=8).digest(), 'big', signed=True)
+        for i in range(NUM_BANDS)
+    ]
+
+
+def init_near_duplicate_index():
+    """Create the signature and LSH band tables if they don't exist."""
+    with sqlite3.connect(get_db_path()) as conn:
+        c = conn.cursor()
+        c.execute('''CREATE TABLE IF NOT EXISTS near_duplicate_signatures
+                     (id INTEGER PRIMARY KEY AUTOINCREMENT, from_name TEXT, signature BLOB,
+                      is_important INTEGER, summary TEXT, ai_summary TEXT, created_at TEXT)''')
+        c.execute('''CREATE TABLE IF NOT EXISTS near_duplicate_bands
+                     (band INTEGER, bucket INTEGER, signature_id INTEGER)''')
+        # Prompt and model the verdict was produced with (migration-safe)
+        try:
+            c.execute('ALTER TABLE near_duplicate_signatures ADD COLUMN verdict_version TEXT')
+        except sqlite3.OperationalError:
+            # Column already exists
+            pass
+        c.execute('CREATE INDEX IF NOT EXISTS idx_near_duplicate_bands ON near_duplicate_bands (band, bucket)')
+        c.execute('CREATE INDEX IF NOT EXISTS idx_near_duplicate_signatures_created_at ON near_duplicate_signatures (created_at)')
+        conn.commit()
+
+
+def find_near_duplicate(signature, from_name: str, verdict_version: str) -> Optional[Dict]:
+    """
+    Look for a recent verdict from the same sender, produced with the same prompt and model (verdict_version),
+    whose signature is at least NEAR_DUP_THRESHOLD similar.
+    Returns {'is_important', 'summary', 'ai_summary', 'similarity'} or None.
+    """
+    import numpy as np
+
+    if signature is None:
+        return None
+    since = (datetime.now(timezone.utc) - timedelta(days=NEAR_DUP_WINDOW_DAYS)).strftime('%Y-%m-%dT%H:%M:%S')
+    band_filter = ' OR '.join(['(b.band = ? AND b.bucket = ?)'] * NUM_BANDS)
+    params = [value for band, bucket in enumerate(_band_buckets(signature)) for value in (band, bucket)]
+    # Verdicts that may not be reused are dropped up front, so they can't mask a reusable, slightly less similar one
+    reuse_filter = '' if NEAR_DUP_REUSE_IMPORTANT else 'AND s.is_important = 0'
+    with sqlite3.connect(get_db_path()) as conn:
+        rows = conn.execute(f'''SELECT DISTINCT s.id, s.signature, s.is_important, s.summary, s.ai_summary
+                                FROM near_duplicate_bands b JOIN near_duplicate_signatures s ON s.id = b.signature_id
+                                WHERE ({band_filter}) AND s.from_name = ? AND s.verdict_version = ? AND s.created_at >= ?
+                                {reuse_filter}''',
+                            params + [from_name or '', verdict_version, since]).fetchall()
+
+    with _stats_lock:
+        _stats['lookups'] += 1
+    if not rows:
+        return None
+
+    candidates = np.stack([np.frombuffer(row[1], dtype=np.uint64) for row in rows])
+    similarities = (candidates == signature[np.newaxis, :]).mean(axis=1)
+    best = int(similarities.argmax())
+    similarity = float(similarities[best])
+    row = rows[best]
+    reusable = similarity >= NEAR_DUP_THRESHOLD
+    with _stats_lock:
+        _stats['candidates'] += 1
+        _stats['last_similarity'] = round(similarity, 3)
+        if reusable:
+            _stats['reuses'] += 1
+        else:
+            _stats['not_reused'] += 1
+    logger.info(f'Near-duplicate candidate {row[0]} from {from_name}: similarity {similarity:.3f} (threshold {NEAR_DUP_THRESHOLD}, reused: {reusable})')
+    if not reusable:
+        return None
+    return {'is_important': bool(row[2]), 'summary': row[3] or '', 'ai_summary': row[4] or '', 'similarity': similarity}
+
+
+def record_verdict(signature, from_name: str, verdict_version: str, result: Dict):
+    """Store an LLM verdict so later near-duplicates can reuse it."""
+    if signature is None:
+        return
+    created_at = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S')
+    with sqlite3.connect(get_db_path()) as conn:
+        c = conn.cursor()
+        c.execute('INSERT INTO near_duplicate_signatures (from_name, signature, is_important, summary, ai_summary, created_at, verdict_version) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                  (from_name or '', signature.tobytes(), int(result['is_important']), result.get('summary'), result.get('ai_summary'), created_at, verdict_version))
+        signature_id = c.lastrowid
+        c.executemany('INSERT INTO near_duplicate_bands (band, bucket, signature_id) VALUES (?, ?, ?)',
+                      [(band, bucket, signature_id) for band, bucket in enumerate(_band_buckets(signature))])
+        conn.commit()
+
+
+def prune_near_duplicate_index() -> int:
+    """Delete signatures that have fallen out of the reuse window. Returns the number removed."""
+    since = (datetime.now(timezone.utc) - timedelta(days=NEAR_DUP_WINDOW_DAYS)).strftime('%Y-%m-%dT%H:%M:%S')
+    with sqlite3.connect(get_db_path()) as conn:
+        c = conn.cursor()
+        c.execute('DELETE FROM near_duplicate_bands WHERE signature_id IN (SELECT id FROM near_duplicate_signatures WHERE created_at < ?)', (since,))
+        removed = c.execute('DELETE FROM near_duplicate_signatures WHERE created_at < ?', (since,)).rowcount
+        conn.commit()
+    logger.info(f'Pruned {removed} near-duplicate signatures older than {since}')
+    return removed
+
+
+def get_near_duplicate_stats() -> Dict:
+    """Lookup and reuse counters since startup, plus the configured threshold."""
+    with _stats_lock:
+        stats = dict(_stats)
+    stats['enabled'] = NEAR_DUP_ENABLED
+    stats['threshold'] = NEAR_DUP_THRESHOLD
+    stats['reuse_rate'] = round(stats['reuses'] / stats['lookups'], 3) if stats['lookups'] else None
+    return stats
@@ -0,0 +1,233 @@
+import os
+import time
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import requests
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+OLLAMA_FAILURE_THRESHOLD = int(os.getenv('OLLAMA_FAILURE_THRESHOLD', '3'))
+OLLAMA_CIRCUIT_COOLDOWN = float(os.getenv('OLLAMA_CIRCUIT_COOLDOWN', '60'))
+
+# Weight given to the newest latency sample in the moving average
+LATENCY_SMOOTHING = 0.3
+
+
+class OllamaUnavailableError(RuntimeError):
+    """No Ollama host could answer the request (all failed or all circuits open)."""
+
+
+def is_host_failure(error: Exception) -> bool:
+    """
+    Only errors that say something about the host's health count against its circuit:
+    connection errors, timeouts and 5xx responses. A 4xx (e.g. an unknown model) is a problem
+    with the request and would fail on every host alike.
+    """
+    if isinstance(error, (requests.ConnectionError, requests.Timeout)):
+        return True
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        return error.response.status_code >= 500
+    return False
+
+
+def get_ollama_urls() -> List[str]:
+    """
+    Read the list of Ollama endpoints from the environment.
+    OLLAMA_API_URLS takes a comma-separated list; OLLAMA_API_URL is used as a single-host fallback.
+    """
+    urls = [url.strip() for url in os.getenv('OLLAMA_API_URLS', '').split(',') if url.strip()]
+    if not urls and os.getenv('OLLAMA_API_URL'):
+        urls = [os.getenv('OLLAMA_API_URL').strip()]
+    return urls
+
+
+class OllamaHost:
+    """Health and load bookkeeping for a single Ollama endpoint."""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.in_flight = 0
+        self.avg_latency = None
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.total_requests = 0
+        self.total_failures = 0
+
+    def is_available(self, now: float) -> bool:
+        """Closed circuits are available; open ones become available again (half-open) after the cooldown."""
+        if self.opened_at is None:
+            return True
+        return now - self.opened_at >= OLLAMA_CIRCUIT_COOLDOWN
+
+    def load_score(self) -> float:
+        """Estimated wait for a new request: queued requests times recent latency."""
+        latency = self.avg_latency if self.avg_latency is not None else 1.0
+        return (self.in_flight + 1) * latency
+
+    def snapshot(self, now: float) -> Dict:
+        if self.opened_at is None:
+            circuit = 'closed'
+        elif self.is_available(now):
+            circuit = 'half-open'
+        else:
+            circuit = 'open'
+        return {
+            'url': self.url,
+            'circuit': circuit,
+            'in_flight': self.in_flight,
+            'avg_latency': round(self.avg_latency, 3) if self.avg_latency is not None else None,
+            'consecutive_failures': self.consecutive_failures,
+            'total_requests': self.total_requests,
+            'total_failures': self.total_failures,
+        }
+
+
+class OllamaPool:
+    """
+    Routes generate requests across several Ollama hosts.
+
+    Each request goes to the least-loaded host whose circuit is not open. A host that fails
+    OLLAMA_FAILURE_THRESHOLD times in a row has its circuit opened for OLLAMA_CIRCUIT_COOLDOWN
+    seconds, and the failed request is retried on another host.
+    """
+
+    def __init__(self, urls: List[str]):
+        self.hosts = [OllamaHost(url) for url in urls]
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.hosts)
+
+    def _acquire(self, exclude) -> Optional[OllamaHost]:
+        now = time.monotonic()
+        with self._lock:
+            candidates = [h for h in self.hosts if h not in exclude and h.is_available(now)]
+            if not candidates:
+                return None
+            host = min(candidates, key=lambda h: h.load_score())
+            if host.opened_at is not None:
+                # Half-open: let this request probe the host and hold the others back for another cooldown
+                host.opened_at = now
+            host.in_flight += 1
+            host.total_requests += 1
+            return host
+
+    def _release(self, host: OllamaHost, latency: Optional[float] = None, error: Optional[Exception] = None):
+        """Finish a request: a latency records a success, an error a host failure, neither leaves health untouched."""
+        with self._lock:
+            host.in_flight -= 1
+            if latency is None and error is None:
+                return
+            if error is None:
+                if host.avg_latency is None:
+                    host.avg_latency = latency
+                else:
+                    host.avg_latency = LATENCY_SMOOTHING * latency + (1 - LATENCY_SMOOTHING) * host.avg_latency
+                if host.opened_at is not None:
+                    logger.info(f'Ollama host {host.url} recovered, closing circuit')
+                host.consecutive_failures = 0
+                host.opened_at = None
+                return
+            host.total_failures += 1
+            host.consecutive_failures += 1
+            if host.opened_at is not None or host.consecutive_failures >= OLLAMA_FAILURE_THRESHOLD:
+                if host.opened_at is None:
+                    logger.warning(f'Opening circuit for Ollama host {host.url} after {host.consecutive_failures} consecutive failures: {error}')
+                # Any further failure while open (e.g. a failed half-open probe) restarts the cooldown
+                host.opened_at = time.monotonic()
+
+    def generate(self, payload: Dict, timeout: float) -> Dict:
+        """
+        POST a generate payload to the best available host, retrying on other hosts on failure.
+        Returns the decoded JSON response.
+        """
+        if not self.hosts:
+            raise OllamaUnavailableError('No Ollama hosts configured (set OLLAMA_API_URLS or OLLAMA_API_URL)')
+        tried = set()
+        last_error = None
+        while True:
+            host = self._acquire(tried)
+            if host is None:
+                break
+            tried.add(host)
+            start = time.monotonic()
+            try:
+                resp = requests.post(host.url, json=payload, timeout=timeout)
+                resp.raise_for_status()
+                data = resp.json()
+            except Exception as e:
+                if not is_host_failure(e):
+                    # The request itself is bad; retrying elsewhere or opening circuits won't help
+                    self._release(host)
+                    raise
+                self._release(host, error=e)
+                logger.warning(f'Ollama request to {host.url} failed: {e}')
+                last_error = e
+                continue
+            self._release(host, latency=time.monotonic() - start)
+            return data
+        if last_error is not None:
+            raise OllamaUnavailableError(f'All Ollama hosts failed, last error: {last_error}')
+        raise OllamaUnavailableError('No healthy Ollama hosts available (all circuits open)')
+
+    def probe(self, payload: Dict, timeout: float) -> Dict:
+        """
+        Send a test payload to every host directly, bypassing load balancing and circuit breaking,
+        so health checks never affect routing. Returns the response text (or an error) per host.
+        """
+        results = {}
+        for host in self.hosts:
+            try:
+                resp = requests.post(host.url, json=payload, timeout=timeout)
+                resp.raise_for_status()
+                results[host.url] = {'status': 'ok', 'test_response': resp.json().get('response', '').strip()[:100]}
+            except Exception as e:
+                results[host.url] = {'status': f'error: {e}', 'test_response': None}
+        return results
+
+    def warm_up(self, model: str, timeout: float) -> Dict:
+        """
+        Ask every host to load the model into memory so the first real request doesn't pay for it.
+        A generate request without a prompt only loads the model. Returns load seconds (or an error) per host.
+        """
+        def load(host):
+            start = time.monotonic()
+            try:
+                resp = requests.post(host.url, json={'model': model}, timeout=timeout)
+                resp.raise_for_status()
+            except Exception as e:
+                logger.warning(f'Failed to preload {model} on {host.url}: {e}')
+                return host.url, f'error: {e}'
+            elapsed = round(time.monotonic() - start, 3)
+            logger.info(f'Preloaded {model} on {host.url} in {elapsed}s')
+            return host.url, elapsed
+
+        if not self.hosts:
+            return {}
+        with ThreadPoolExecutor(max_workers=len(self.hosts)) as executor:
+            return dict(executor.map(load, self.hosts))
+
+    def snapshot(self) -> List[Dict]:
+        now = time.monotonic()
+        with self._lock:
+            return [host.snapshot(now) for host in self.hosts]
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> OllamaPool:
+    """Get the process-wide Ollama pool, building it from the environment on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = OllamaPool(get_ollama_urls())
+            logger.info(f'Ollama pool initialized with hosts: {[h.url for h in _pool.hosts]}')
+        return _pool
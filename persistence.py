@@ -1,7 +1,9 @@
 import sqlite3
-from typing import List, Dict
+from typing import List, Dict, Optional, Set
 import os
 import logging
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
 
 logger = logging.getLogger(__name__)
 
@@ -43,6 +45,22 @@ def ensure_data_dir():
         logger.info('Using current directory for database')
 
 
+def parse_received_at(date: str) -> Optional[str]:
+    """Convert an email Date header to a sortable UTC ISO timestamp, or None if it can't be parsed."""
+    try:
+        parsed = parsedate_to_datetime(date)
+    except Exception:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S')
+
+
+def utc_now() -> str:
+    """Current time in the same format as parse_received_at."""
+    return datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S')
+
+
 def init_db():
     """Initialize the SQLite database and create the summaries table if it doesn't exist."""
     global _fallback_db_path
@@ -68,6 +86,11 @@ def init_db():
             raise e  # Re-raise the original error
 
     c = conn.cursor()
+    # On a brand-new database incremental auto-vacuum can be enabled for free, before any table exists.
+    # Existing databases are converted by the retention job, which needs a full VACUUM for it.
+    c.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'table'")
+    if c.fetchone()[0] == 0:
+        c.execute('PRAGMA auto_vacuum = INCREMENTAL')
     c.execute('''CREATE TABLE IF NOT EXISTS summaries
                  (uid INTEGER PRIMARY KEY, subject TEXT, from_name TEXT, date TEXT, summary TEXT)''')
 
@@ -78,6 +101,41 @@ def init_db():
         # Column already exists
         pass
 
+    # Add received_at column so retention can select old rows in SQL (migration-safe)
+    try:
+        c.execute('ALTER TABLE summaries ADD COLUMN received_at TEXT')
+    except sqlite3.OperationalError:
+        # Column already exists
+        pass
+    c.execute('CREATE INDEX IF NOT EXISTS idx_summaries_received_at ON summaries (received_at)')
+
+    # Backfill received_at for rows stored before the column existed.
+    # Unparseable dates fall back to now, like new inserts, so retention still reaches them eventually.
+    c.execute('SELECT uid, date FROM summaries WHERE received_at IS NULL')
+    now = utc_now()
+    backfill = [(parse_received_at(date) or now, uid) for uid, date in c.fetchall()]
+    if backfill:
+        c.executemany('UPDATE summaries SET received_at = ? WHERE uid = ?', backfill)
+        logger.info(f'Backfilled received_at for {len(backfill)} summaries')
+
+    # Change counter for the summaries table, bumped by triggers on every insert, replace, update
+    # and delete (uid is the rowid, so row counts and MAX(rowid) can't detect in-place rewrites)
+    c.execute('CREATE TABLE IF NOT EXISTS summaries_version (id INTEGER PRIMARY KEY CHECK (id = 1), version INTEGER NOT NULL)')
+    c.execute('INSERT OR IGNORE INTO summaries_version (id, version) VALUES (1, 0)')
+    for event in ('INSERT', 'UPDATE', 'DELETE'):
+        c.execute(f'''CREATE TRIGGER IF NOT EXISTS summaries_version_{event.lower()} AFTER {event} ON summaries
+                      BEGIN UPDATE summaries_version SET version = version + 1 WHERE id = 1; END''')
+
+    # Every classification, keyed by prompt and model, so results can be compared across changes
+    c.execute('''CREATE TABLE IF NOT EXISTS summary_versions
+                 (uid INTEGER, prompt_version TEXT, model TEXT, is_important INTEGER, summary TEXT, ai_summary TEXT,
+                  reason TEXT, created_at TEXT, PRIMARY KEY (uid, prompt_version, model))''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_summary_versions_created_at ON summary_versions (created_at)')
+
+    # Failed processing attempts per UID, so an email that can never be classified is eventually given up on
+    c.execute('''CREATE TABLE IF NOT EXISTS email_attempts
+                 (uid INTEGER PRIMARY KEY, attempts INTEGER NOT NULL, last_attempt_at TEXT)''')
+
     conn.commit()
     conn.close()
 
@@ -86,13 +144,69 @@ def insert_summary(uid: int, subject: str, from_name: str, date: str, summary: s
     """Insert a summary into the database."""
     conn = sqlite3.connect(get_db_path())
     c = conn.cursor()
-    # Insert with both old and new summary formats for compatibility
-    c.execute('INSERT OR REPLACE INTO summaries (uid, subject, from_name, date, summary, ai_summary) VALUES (?, ?, ?, ?, ?, ?)',
-              (uid, subject, from_name, date, summary, ai_summary))
+    # Insert with both old and new summary formats for compatibility.
+    # Without a parseable Date header the insert time stands in, so retention can still select the row.
+    c.execute('INSERT OR REPLACE INTO summaries (uid, subject, from_name, date, summary, ai_summary, received_at) VALUES (?, ?, ?, ?, ?, ?, ?)',
+              (uid, subject, from_name, date, summary, ai_summary, parse_received_at(date) or utc_now()))
     conn.commit()
     conn.close()
 
 
+def delete_summary(uid: int):
+    """Remove a summary from the feed table."""
+    with sqlite3.connect(get_db_path()) as conn:
+        conn.execute('DELETE FROM summaries WHERE uid = ?', (uid,))
+        conn.commit()
+
+
+def insert_summary_version(uid: int, prompt_version: str, model: str, result: Dict):
+    """Record a classification result for a given prompt version and model."""
+    created_at = utc_now()
+    with sqlite3.connect(get_db_path()) as conn:
+        conn.execute('INSERT OR REPLACE INTO summary_versions (uid, prompt_version, model, is_important, summary, ai_summary, reason, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                     (uid, prompt_version, model, int(result['is_important']), result.get('summary'), result.get('ai_summary'), result.get('reason'), created_at))
+        conn.commit()
+
+
+def get_finished_uids(after_uid: int, prompt_version: str, model: str, max_attempts: int) -> Set[int]:
+    """
+    UIDs above after_uid that need no further processing: already classified under this prompt and model,
+    or given up on after max_attempts failures. Finished UIDs above a held-back checkpoint are found this way.
+    """
+    with sqlite3.connect(get_db_path()) as conn:
+        classified = conn.execute('SELECT uid FROM summary_versions WHERE uid > ? AND prompt_version = ? AND model = ?',
+                                  (after_uid, prompt_version, model)).fetchall()
+        exhausted = conn.execute('SELECT uid FROM email_attempts WHERE uid > ? AND attempts >= ?',
+                                 (after_uid, max_attempts)).fetchall()
+    return {row[0] for row in classified + exhausted}
+
+
+def record_failed_attempt(uid: int) -> int:
+    """Count a failed processing attempt for an email. Returns the number of failed attempts so far."""
+    with sqlite3.connect(get_db_path()) as conn:
+        conn.execute('''INSERT INTO email_attempts (uid, attempts, last_attempt_at) VALUES (?, 1, ?)
+                        ON CONFLICT (uid) DO UPDATE SET attempts = attempts + 1, last_attempt_at = excluded.last_attempt_at''',
+                     (uid, utc_now()))
+        conn.commit()
+        return conn.execute('SELECT attempts FROM email_attempts WHERE uid = ?', (uid,)).fetchone()[0]
+
+
+def clear_failed_attempts(uid: int):
+    """Forget earlier failed attempts once an email has been processed."""
+    with sqlite3.connect(get_db_path()) as conn:
+        conn.execute('DELETE FROM email_attempts WHERE uid = ?', (uid,))
+        conn.commit()
+
+
+def get_summaries_version() -> int:
+    """
+    Change counter of the summaries table; it increases whenever rows are inserted, replaced, updated or removed.
+    Used to invalidate the rendered feed.
+    """
+    with sqlite3.connect(get_db_path()) as conn:
+        return conn.execute('SELECT version FROM summaries_version WHERE id = 1').fetchone()[0]
+
+
 def fetch_all_summaries():
     """Fetch all summaries from the database."""
     with sqlite3.connect(get_db_path()) as conn:
@@ -0,0 +1,104 @@
+import os
+import threading
+import logging
+from typing import Callable, Dict, List, Optional
+
+from dotenv import load_dotenv
+from persistence import parse_received_at
+from summarizer import EMAIL_WHITELIST, EMAIL_BLACKLIST
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Comma-separated sort keys, most significant first: sender, triage, recency
+PRIORITY_ORDER = [key.strip().lower() for key in os.getenv('PRIORITY_ORDER', 'sender,triage,recency').split(',') if key.strip()]
+# Senders processed ahead of everyone else (matched like EMAIL_WHITELIST, on the sender name/address)
+PRIORITY_SENDERS = set(s.strip().lower() for s in os.getenv('PRIORITY_SENDERS', '').split(',') if s.strip())
+
+# Subject keywords used for a cheap pre-triage before the LLM sees anything
+URGENT_KEYWORDS = ['urgent', 'asap', 'action required', 'immediately', 'deadline', 'overdue', 'past due',
+                   'security alert', 'password', 'expires', 'final notice']
+URGENT_KEYWORDS += [k.strip().lower() for k in os.getenv('PRIORITY_KEYWORDS', '').split(',') if k.strip()]
+BULK_KEYWORDS = ['newsletter', 'digest', 'webinar', 'sale', '% off', 'deal', 'promo', 'unsubscribe', 'weekly', 'new arrivals']
+
+
+def sender_score(email: Dict) -> int:
+    """2 for priority senders, 1 for whitelisted, -1 for blacklisted, 0 otherwise."""
+    sender = f"{email.get('from_name') or ''} {email.get('from_addr') or ''}".lower()
+    if any(s in sender for s in PRIORITY_SENDERS):
+        return 2
+    if any(s in sender for s in EMAIL_WHITELIST):
+        return 1
+    if any(s in sender for s in EMAIL_BLACKLIST):
+        return -1
+    return 0
+
+
+def triage_score(email: Dict) -> int:
+    """Urgent-looking subjects score positive, bulk-looking subjects negative."""
+    subject = (email.get('subject') or '').lower()
+    return sum(1 for k in URGENT_KEYWORDS if k in subject) - sum(1 for k in BULK_KEYWORDS if k in subject)
+
+
+def recency_score(email: Dict) -> str:
+    """Sortable received timestamp; unparseable dates sort as oldest."""
+    return parse_received_at(email.get('date') or '') or ''
+
+
+SCORERS = {
+    'sender': sender_score,
+    'triage': triage_score,
+    'recency': recency_score,
+}
+
+
+def prioritize(emails: List[Dict]) -> List[Dict]:
+    """Order emails by the PRIORITY_ORDER keys, highest first; ties go to the newest UID."""
+    keys = [key for key in PRIORITY_ORDER if key in SCORERS]
+    unknown = [key for key in PRIORITY_ORDER if key not in SCORERS]
+    if unknown:
+        logger.warning(f'Ignoring unknown PRIORITY_ORDER keys: {unknown}')
+    return sorted(emails, key=lambda e: tuple(SCORERS[key](e) for key in keys) + (e['uid'],), reverse=True)
+
+
+def priority_tier(email: Dict) -> str:
+    """Coarse tier used for time-to-feed metrics."""
+    if sender_score(email) > 0 or triage_score(email) > 0:
+        return 'high'
+    if sender_score(email) < 0 or triage_score(email) < 0:
+        return 'low'
+    return 'normal'
+
+
+class UidCheckpoint:
+    """
+    Tracks the last UID that is safe to persist when emails finish out of order.
+
+    The checkpoint only moves past a UID once it and every lower pending UID are done,
+    so a crash mid-run never skips unprocessed mail. on_advance is called with each new
+    checkpoint while holding the lock, so writes happen in order.
+    """
+
+    def __init__(self, start_uid: int, pending_uids: List[int], on_advance: Callable[[int], None]):
+        self.uid = start_uid
+        self._pending = sorted(pending_uids)
+        self._next = 0
+        self._done = set()
+        self._on_advance = on_advance
+        self._lock = threading.Lock()
+
+    def mark_done(self, uid: int) -> Optional[int]:
+        """Mark a UID as finished. Returns the new checkpoint if it advanced."""
+        with self._lock:
+            self._done.add(uid)
+            advanced = False
+            while self._next < len(self._pending) and self._pending[self._next] in self._done:
+                self.uid = self._pending[self._next]
+                self._done.discard(self.uid)
+                self._next += 1
+                advanced = True
+            if not advanced:
+                return None
+            self._on_advance(self.uid)
+            return self.uid
@@ -0,0 +1,87 @@
+"""
+Re-run classification over messages in the local message store, without touching IMAP.
+
+Every verdict is recorded in summary_versions under the current prompt version and model,
+so the effect of a system_prompt.md or OLLAMA_MODEL change can be compared against earlier runs.
+
+Usage:
+    python reprocess.py [--since-uid N] [--until-uid N] [--model MODEL] [--workers N] [--update-feed]
+"""
+import argparse
+import logging
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+from email_fetcher import parse_message
+from message_store import get_message_store, get_message_store_dir, MessageStore
+from ollama_pool import get_pool
+from persistence import init_db, get_db_path, insert_summary, delete_summary, insert_summary_version
+from summarizer import summarize_email, get_prompt_version, is_error_result, OLLAMA_MODEL
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def reprocess_uid(store, uid, model, prompt_version, update_feed):
+    raw_msg = store.get(uid)
+    email = parse_message(uid, raw_msg)
+    # Near-duplicate reuse would return verdicts instead of re-evaluating the message
+    result = summarize_email(email['subject'], email['from_name'], email['date'], email['body'],
+                             model=model, use_near_duplicates=False)
+    if is_error_result(result):
+        # An LLM error is not a verdict: keep it out of summary_versions and count it as failed
+        logger.error(f'Error reprocessing UID {uid}: {result["reason"]}')
+        return uid, None
+    insert_summary_version(uid, prompt_version, model, result)
+    if update_feed:
+        if result['is_important']:
+            insert_summary(uid, email['subject'], email['from_name'], email['date'], result['summary'], result.get('ai_summary'))
+        else:
+            delete_summary(uid)
+    return uid, result['is_important']
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Re-run classification over the local message store.')
+    parser.add_argument('--since-uid', type=int, default=None, help='First UID to reprocess (inclusive)')
+    parser.add_argument('--until-uid', type=int, default=None, help='Last UID to reprocess (inclusive)')
+    parser.add_argument('--model', default=OLLAMA_MODEL, help='Ollama model to use (default: OLLAMA_MODEL)')
+    parser.add_argument('--workers', type=int, default=None, help='Parallel workers (default: one per Ollama host)')
+    parser.add_argument('--update-feed', action='store_true', help='Also replace the results shown in /rss')
+    args = parser.parse_args()
+
+    init_db()
+    # Reprocessing only reads the store, so it works even if new fetches have storing disabled
+    store = get_message_store() or MessageStore(get_message_store_dir())
+    uids = store.uids(args.since_uid, args.until_uid)
+    prompt_version = get_prompt_version()
+    workers = args.workers or max(1, len(get_pool()))
+    logger.info(f'Reprocessing {len(uids)} stored messages with model {args.model}, prompt version {prompt_version}, {workers} worker(s)')
+
+    # Feed membership before reprocessing, for the comparison below
+    with sqlite3.connect(get_db_path()) as conn:
+        previously_important = {row[0] for row in conn.execute('SELECT uid FROM summaries')}
+
+    def run(uid):
+        try:
+            return reprocess_uid(store, uid, args.model, prompt_version, args.update_feed)
+        except Exception as e:
+            logger.error(f'Error reprocessing UID {uid}: {e}')
+            return uid, None
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(run, uids))
+
+    important = [uid for uid, is_important in results if is_important]
+    failed = [uid for uid, is_important in results if is_important is None]
+    became_important = [uid for uid, is_important in results if is_important and uid not in previously_important]
+    became_unimportant = [uid for uid, is_important in results if is_important is False and uid in previously_important]
+    print(f'Reprocessed {len(results)} messages (prompt {prompt_version}, model {args.model})')
+    print(f'  Important: {len(important)}, failed: {len(failed)}')
+    print(f'  Newly important vs. current feed: {became_important}')
+    print(f'  No longer important vs. current feed: {became_unimportant}')
+    print('Compare versions with: SELECT * FROM summary_versions WHERE uid = ? ORDER BY created_at')
+
+
+if __name__ == '__main__':
+    main()
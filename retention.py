@@ -0,0 +1,186 @@
+import os
+import zlib
+import sqlite3
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Dict
+
+from dotenv import load_dotenv
+from persistence import get_db_path
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Summaries older than this many days are moved out of the hot table (0 disables archiving)
+RETENTION_DAYS = int(os.getenv('RETENTION_DAYS', '90'))
+# 'table' keeps the archive in summaries.db, 'database' moves it to a separate summaries_archive.db
+RETENTION_ARCHIVE = os.getenv('RETENTION_ARCHIVE', 'table').lower()
+# Free pages reclaimed per maintenance run (0 reclaims the whole freelist)
+RETENTION_VACUUM_PAGES = int(os.getenv('RETENTION_VACUUM_PAGES', '2000'))
+
+ARCHIVE_SCHEMA = '''CREATE TABLE IF NOT EXISTS {schema}.summaries_archive
+                    (uid INTEGER PRIMARY KEY, subject TEXT, from_name TEXT, date TEXT, received_at TEXT,
+                     summary BLOB, ai_summary BLOB, archived_at TEXT)'''
+VERSIONS_ARCHIVE_SCHEMA = '''CREATE TABLE IF NOT EXISTS {schema}.summary_versions_archive
+                             (uid INTEGER, prompt_version TEXT, model TEXT, is_important INTEGER, summary BLOB, ai_summary BLOB,
+                              reason TEXT, created_at TEXT, archived_at TEXT, PRIMARY KEY (uid, prompt_version, model))'''
+
+
+def get_archive_path():
+    """Get the path of the separate archive database used when RETENTION_ARCHIVE=database."""
+    return os.path.join(os.path.dirname(get_db_path()) or '.', 'summaries_archive.db')
+
+
+def _compress(text):
+    if text is None:
+        return None
+    return zlib.compress(text.encode('utf-8'), 9)
+
+
+def _connect():
+    """
+    Open the main database in autocommit mode with the archive available as the 'archive' schema.
+    """
+    conn = sqlite3.connect(get_db_path(), isolation_level=None)
+    conn.create_function('zlib_compress', 1, _compress, deterministic=True)
+    if RETENTION_ARCHIVE == 'database':
+        conn.execute('ATTACH DATABASE ? AS archive', (get_archive_path(),))
+        schema = 'archive'
+    else:
+        schema = 'main'
+    conn.execute(ARCHIVE_SCHEMA.format(schema=schema))
+    conn.execute(VERSIONS_ARCHIVE_SCHEMA.format(schema=schema))
+    return conn, schema
+
+
+def archive_old_summaries(days: int = None) -> int:
+    """
+    Move summaries received more than `days` days ago into the compressed archive table.
+    Returns the number of rows moved.
+    """
+    days = RETENTION_DAYS if days is None else days
+    if days <= 0:
+        logger.info('Retention archiving disabled (RETENTION_DAYS=0)')
+        return 0
+
+    cutoff = (datetime.now(timezone.utc) - timedelta(days=days)).strftime('%Y-%m-%dT%H:%M:%S')
+    archived_at = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S')
+    conn, schema = _connect()
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        conn.execute(f'''INSERT OR REPLACE INTO {schema}.summaries_archive
+                         (uid, subject, from_name, date, received_at, summary, ai_summary, archived_at)
+                         SELECT uid, subject, from_name, date, received_at,
+                                zlib_compress(summary), zlib_compress(ai_summary), ?
+                         FROM main.summaries WHERE received_at < ?''', (archived_at, cutoff))
+        moved = conn.execute('DELETE FROM main.summaries WHERE received_at < ?', (cutoff,)).rowcount
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+    finally:
+        conn.close()
+
+    logger.info(f'Archived {moved} summaries received before {cutoff} to {schema}.summaries_archive')
+    return moved
+
+
+def archive_old_summary_versions(days: int = None) -> int:
+    """
+    Move classification history recorded more than `days` days ago into the compressed archive,
+    and drop failed-attempt records that old. Returns the number of summary_versions rows moved.
+    """
+    days = RETENTION_DAYS if days is None else days
+    if days <= 0:
+        return 0
+
+    cutoff = (datetime.now(timezone.utc) - timedelta(days=days)).strftime('%Y-%m-%dT%H:%M:%S')
+    archived_at = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S')
+    conn, schema = _connect()
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        conn.execute(f'''INSERT OR REPLACE INTO {schema}.summary_versions_archive
+                         (uid, prompt_version, model, is_important, summary, ai_summary, reason, created_at, archived_at)
+                         SELECT uid, prompt_version, model, is_important, zlib_compress(summary), zlib_compress(ai_summary),
+                                reason, created_at, ?
+                         FROM main.summary_versions WHERE created_at < ?''', (archived_at, cutoff))
+        moved = conn.execute('DELETE FROM main.summary_versions WHERE created_at < ?', (cutoff,)).rowcount
+        conn.execute('DELETE FROM main.email_attempts WHERE last_attempt_at < ?', (cutoff,))
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+    finally:
+        conn.close()
+
+    logger.info(f'Archived {moved} summary versions recorded before {cutoff} to {schema}.summary_versions_archive')
+    return moved
+
+
+def run_maintenance() -> Dict:
+    """
+    Reclaim free pages with an incremental VACUUM and refresh query planner statistics.
+    Returns the database size report after maintenance.
+    """
+    conn = sqlite3.connect(get_db_path(), isolation_level=None)
+    try:
+        # Databases created before incremental auto-vacuum need one full VACUUM to switch modes.
+        # It runs here, in the background job, rather than at startup.
+        if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+            logger.info('Enabling incremental auto-vacuum (one-time full VACUUM)')
+            conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+            conn.execute('VACUUM')
+        freelist_before = conn.execute('PRAGMA freelist_count').fetchone()[0]
+        # incremental_vacuum returns a row per step, so it has to be fully consumed
+        conn.execute(f'PRAGMA incremental_vacuum({RETENTION_VACUUM_PAGES})').fetchall()
+        freelist_after = conn.execute('PRAGMA freelist_count').fetchone()[0]
+        conn.execute('ANALYZE')
+    finally:
+        conn.close()
+    logger.info(f'Incremental vacuum reclaimed {freelist_before - freelist_after} pages, ANALYZE complete')
+    return get_db_size_report()
+
+
+def get_db_size_report() -> Dict:
+    """Report on-disk size and row counts for the hot table and the archive."""
+    report = {}
+    with sqlite3.connect(get_db_path()) as conn:
+        page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+        page_count = conn.execute('PRAGMA page_count').fetchone()[0]
+        freelist_count = conn.execute('PRAGMA freelist_count').fetchone()[0]
+        report['db_bytes'] = page_size * page_count
+        report['free_bytes'] = page_size * freelist_count
+        report['hot_rows'] = conn.execute('SELECT COUNT(*) FROM summaries').fetchone()[0]
+        report['version_rows'] = conn.execute('SELECT COUNT(*) FROM summary_versions').fetchone()[0]
+        if RETENTION_ARCHIVE != 'database':
+            try:
+                report['archive_rows'] = conn.execute('SELECT COUNT(*) FROM summaries_archive').fetchone()[0]
+            except sqlite3.OperationalError:
+                report['archive_rows'] = 0
+    if RETENTION_ARCHIVE == 'database':
+        archive_path = get_archive_path()
+        report['archive_bytes'] = os.path.getsize(archive_path) if os.path.exists(archive_path) else 0
+        if os.path.exists(archive_path):
+            with sqlite3.connect(archive_path) as conn:
+                try:
+                    report['archive_rows'] = conn.execute('SELECT COUNT(*) FROM summaries_archive').fetchone()[0]
+                except sqlite3.OperationalError:
+                    report['archive_rows'] = 0
+        else:
+            report['archive_rows'] = 0
+    report['retention_days'] = RETENTION_DAYS
+    report['archive_mode'] = RETENTION_ARCHIVE
+    return report
+
+
+def run_retention():
+    """Scheduled retention job: archive old summaries and classification history, then vacuum and analyze."""
+    logger.info('Starting retention run...')
+    try:
+        archive_old_summaries()
+        archive_old_summary_versions()
+        report = run_maintenance()
+        logger.info(f'Retention run complete. Database size: {report}')
+    except Exception as e:
+        logger.error(f'Retention run failed: {e}')
@@ -1,13 +1,14 @@
 import os
-import requests
 from dotenv import load_dotenv
 from typing import Dict
 import logging
 import re
+import hashlib
+from ollama_pool import get_pool, OllamaUnavailableError
+from near_duplicates import NEAR_DUP_ENABLED, compute_signature, find_near_duplicate, record_verdict
 
 load_dotenv()
 
-OLLAMA_API_URL = os.getenv('OLLAMA_API_URL')
 OLLAMA_MODEL = os.getenv('OLLAMA_MODEL', 'llama3')
 OLLAMA_TIMEOUT = int(os.getenv('OLLAMA_TIMEOUT', '60'))
 CLEAN_THINKING_CONTENT = os.getenv('CLEAN_THINKING_CONTENT', 'true').lower() == 'true'
@@ -45,6 +46,17 @@ def get_prompt_template():
 
 logger = logging.getLogger(__name__)
 
+def get_prompt_version() -> str:
+    """
+    Short fingerprint of the current prompt template (after user name substitution).
+    Stored with every classification so results from different prompts can be compared.
+    """
+    return hashlib.sha256(get_prompt_template().encode('utf-8')).hexdigest()[:12]
+
+def is_error_result(result: Dict) -> bool:
+    """True if summarize_email failed instead of reaching a verdict."""
+    return (result.get('reason') or '').startswith('Error')
+
 def clean_llm_response(response_text: str) -> str:
     """
     Clean LLM response by removing thinking/reasoning content from models like DeepSeek-R1.
@@ -91,11 +103,14 @@ def clean_llm_response(response_text: str) -> str:
 
     return cleaned_text
 
-def summarize_email(subject: str, from_name: str, date: str, body: str) -> Dict:
+def summarize_email(subject: str, from_name: str, date: str, body: str, model: str = None, use_near_duplicates: bool = True) -> Dict:
     """
     Send the email to Ollama for importance filtering and summarization.
+    model overrides OLLAMA_MODEL; use_near_duplicates=False forces an LLM call even for near-duplicates.
     Returns: {'is_important': bool, 'summary': str, 'ai_summary': str, 'reason': str or None}
+    Raises OllamaUnavailableError if no Ollama host could answer, so the caller can retry the email later.
     """
+    model = model or OLLAMA_MODEL
     from_name_lower = (from_name or '').lower()
     # Whitelist: always important
     if any(whitelisted in from_name_lower for whitelisted in EMAIL_WHITELIST):
@@ -103,17 +118,28 @@ def summarize_email(subject: str, from_name: str, date: str, body: str) -> Dict:
     # Blacklist: always not important
     if any(blacklisted in from_name_lower for blacklisted in EMAIL_BLACKLIST):
         return {'is_important': False, 'summary': '', 'ai_summary': '', 'reason': 'Sender is blacklisted'}
+    # Near-duplicate of a recent email: reuse its verdict instead of calling the LLM
+    signature = None
+    # Verdicts are only reused under the same prompt and model they were produced with
+    verdict_version = f'{model}:{get_prompt_version()}'
+    if NEAR_DUP_ENABLED and use_near_duplicates:
+        try:
+            signature = compute_signature(subject, body)
+            match = find_near_duplicate(signature, from_name, verdict_version)
+            if match:
+                return {'is_important': match['is_important'], 'summary': match['summary'], 'ai_summary': match['ai_summary'],
+                        'reason': f"Near-duplicate of an earlier email (similarity {match['similarity']:.2f})"}
+        except Exception as e:
+            logger.error(f"Near-duplicate lookup failed: {e}")
     prompt_template = get_prompt_template()
     prompt = prompt_template.format(subject=subject, from_addr=from_name, date=date, body=body)
     payload = {
-        "model": OLLAMA_MODEL,
+        "model": model,
         "prompt": prompt,
         "stream": False
     }
     try:
-        resp = requests.post(OLLAMA_API_URL, json=payload, timeout=OLLAMA_TIMEOUT)
-        resp.raise_for_status()
-        data = resp.json()
+        data = get_pool().generate(payload, timeout=OLLAMA_TIMEOUT)
         raw_response = data.get('response', '').strip()
         logger.info(f"Raw LLM response:\n{raw_response}")
 
@@ -126,10 +152,20 @@ def summarize_email(subject: str, from_name: str, date: str, body: str) -> Dict:
             logger.info("Thinking content cleaning is disabled")
 
         if response_text.upper().startswith('NOT IMPORTANT'):
-            return {'is_important': False, 'summary': '', 'ai_summary': '', 'reason': None}
-
-        # For important emails, the response is now clean summary text
-        return {'is_important': True, 'summary': response_text, 'ai_summary': response_text, 'reason': None}
+            result = {'is_important': False, 'summary': '', 'ai_summary': '', 'reason': None}
+        else:
+            # For important emails, the response is now clean summary text
+            result = {'is_important': True, 'summary': response_text, 'ai_summary': response_text, 'reason': None}
+    except OllamaUnavailableError:
+        # Not a verdict: the email has to be retried rather than treated as not important
+        raise
     except Exception as e:
         logger.error(f"Error from LLM: {e}")
-        return {'is_important': False, 'summary': '', 'ai_summary': '', 'reason': f'Error: {e}'}
\ No newline at end of file
+        return {'is_important': False, 'summary': '', 'ai_summary': '', 'reason': f'Error: {e}'}
+
+    if signature is not None:
+        try:
+            record_verdict(signature, from_name, verdict_version, result)
+        except Exception as e:
+            logger.error(f"Failed to record verdict in near-duplicate index: {e}")
+    return result
\ No newline at end of file
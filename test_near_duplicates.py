@@ -0,0 +1,70 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from near_duplicates import (NEAR_DUP_THRESHOLD, compute_signature, find_near_duplicate, init_near_duplicate_index,
+                             normalize_text, record_verdict)
+
+
+def similarity(a, b):
+    """Estimated Jaccard similarity of two (subject, body) pairs, as find_near_duplicate computes it."""
+    return float((compute_signature(*a) == compute_signature(*b)).mean())
+
+
+STATEMENT = ('Your daily statement for {date}',
+             'Hello, your balance on {date} is {amount}. Your available credit is {credit}. '
+             'Log in to your account to view recent transactions and pending payments. '
+             'Thank you for banking with us.')
+
+SHIPPED = ('Your order has shipped',
+           'Good news! Your order #{order} shipped on {weekday}, {month} {day} and should arrive by {arrival}. '
+           'You can track the package from your orders page. Thanks for shopping with us.')
+
+
+def test_normalize_text_collapses_numeric_tokens():
+    assert normalize_text('Balance: $1,234.56 on 2024-01-31 at 10:30') == normalize_text('Balance: $87.00 on 2024-02-01 at 9:05')
+    assert normalize_text('Order 123-456-789 arrives on the 21st') == normalize_text('Order 98-7 arrives on the 2nd')
+
+
+def test_normalize_text_collapses_month_and_weekday_names():
+    assert normalize_text('Shipped Monday, January 5') == normalize_text('Shipped Thu, Sept 18')
+    assert 'monthly' in normalize_text('Your monthly report')
+
+
+def test_statements_differing_in_amount_and_date_are_near_duplicates():
+    first = (STATEMENT[0].format(date='2024-03-01'),
+             STATEMENT[1].format(date='2024-03-01', amount='$1,204.17', credit='$3,795.83'))
+    second = (STATEMENT[0].format(date='2024-03-02'),
+              STATEMENT[1].format(date='2024-03-02', amount='$987.40', credit='$4,012.60'))
+    assert similarity(first, second) >= NEAR_DUP_THRESHOLD
+
+
+def test_shipping_notices_differing_in_month_are_near_duplicates():
+    first = (SHIPPED[0], SHIPPED[1].format(order='112-3345', weekday='Monday', month='January', day='29th', arrival='Feb 2'))
+    second = (SHIPPED[0], SHIPPED[1].format(order='98-1201', weekday='Friday', month='March', day='1st', arrival='Mar 6'))
+    assert similarity(first, second) >= NEAR_DUP_THRESHOLD
+
+
+def test_different_emails_are_not_near_duplicates():
+    statement = (STATEMENT[0].format(date='2024-03-01'),
+                 STATEMENT[1].format(date='2024-03-01', amount='$1,204.17', credit='$3,795.83'))
+    invite = ('Team offsite planning',
+              'Hi all, we are planning the offsite for next quarter. Please reply with your preferred '
+              'venue and any dietary requirements so we can book catering in time.')
+    assert similarity(statement, invite) < 0.2
+
+
+def test_important_verdict_does_not_mask_reusable_one(tmp_path, monkeypatch):
+    monkeypatch.setenv('DATA_DIR', str(tmp_path))
+    init_near_duplicate_index()
+    body = STATEMENT[1].format(date='2024-03-01', amount='$1,204.17', credit='$3,795.83')
+    # The identical email was important (not reusable by default); a slightly different one was not
+    record_verdict(compute_signature(STATEMENT[0], body), 'Bank', 'v1',
+                   {'is_important': True, 'summary': 'Balance', 'ai_summary': 'Balance'})
+    record_verdict(compute_signature(STATEMENT[0], body + ' Regards, the team.'), 'Bank', 'v1',
+                   {'is_important': False, 'summary': '', 'ai_summary': ''})
+
+    match = find_near_duplicate(compute_signature(STATEMENT[0], body), 'Bank', 'v1')
+    assert match is not None
+    assert match['is_important'] is False
+    assert NEAR_DUP_THRESHOLD <= match['similarity'] < 1.0
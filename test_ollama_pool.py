@@ -0,0 +1,168 @@
+import pytest
+import requests
+
+import ollama_pool
+from ollama_pool import OllamaPool, OllamaUnavailableError, OLLAMA_FAILURE_THRESHOLD
+
+PAYLOAD = {'model': 'llama3', 'prompt': 'Test', 'stream': False}
+
+
+class FakeResponse:
+    def __init__(self, status_code=200, body=None):
+        self.status_code = status_code
+        self._body = body if body is not None else {'response': 'ok'}
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f'{self.status_code} error', response=self)
+
+    def json(self):
+        return self._body
+
+
+@pytest.fixture
+def hosts(monkeypatch):
+    """
+    Route requests.post to per-URL behaviours and record the URLs called.
+    A behaviour is a FakeResponse or an exception to raise; URLs without one answer 200.
+    """
+    behaviours = {}
+    calls = []
+    clock = [1000.0]
+
+    def post(url, json=None, timeout=None):
+        calls.append(url)
+        behaviour = behaviours.get(url, FakeResponse(body={'response': url}))
+        if isinstance(behaviour, Exception):
+            raise behaviour
+        return behaviour
+
+    monkeypatch.setattr(ollama_pool.requests, 'post', post)
+    monkeypatch.setattr(ollama_pool.time, 'monotonic', lambda: clock[0])
+    return behaviours, calls, clock
+
+
+def test_routes_to_least_loaded_host(hosts):
+    pool = OllamaPool(['http://a', 'http://b'])
+    pool.hosts[0].in_flight = 2
+    assert pool.generate(PAYLOAD, timeout=1) == {'response': 'http://b'}
+
+    pool.hosts[0].in_flight = 0
+    pool.hosts[0].avg_latency = 5.0
+    pool.hosts[1].avg_latency = 0.5
+    assert pool.generate(PAYLOAD, timeout=1) == {'response': 'http://b'}
+
+
+def test_fails_over_to_another_host(hosts):
+    behaviours, calls, _ = hosts
+    behaviours['http://a'] = requests.ConnectionError('refused')
+    pool = OllamaPool(['http://a', 'http://b'])
+    pool.hosts[1].avg_latency = 2.0  # Makes a the first choice
+
+    assert pool.generate(PAYLOAD, timeout=1) == {'response': 'http://b'}
+    assert calls == ['http://a', 'http://b']
+    assert pool.hosts[0].consecutive_failures == 1
+    assert all(host.in_flight == 0 for host in pool.hosts)
+
+
+def test_circuit_opens_after_consecutive_failures(hosts):
+    behaviours, calls, _ = hosts
+    behaviours['http://a'] = requests.Timeout('timed out')
+    pool = OllamaPool(['http://a', 'http://b'])
+    for _ in range(OLLAMA_FAILURE_THRESHOLD):
+        pool.hosts[1].avg_latency = 2.0  # Keeps a the first choice while its circuit is closed
+        pool.generate(PAYLOAD, timeout=1)
+    assert pool.snapshot()[0]['circuit'] == 'open'
+
+    calls.clear()
+    pool.generate(PAYLOAD, timeout=1)
+    assert calls == ['http://b']
+
+
+def test_half_open_probe_closes_or_reopens_circuit(hosts):
+    behaviours, calls, clock = hosts
+    behaviours['http://a'] = requests.ConnectionError('refused')
+    pool = OllamaPool(['http://a'])
+    for _ in range(OLLAMA_FAILURE_THRESHOLD):
+        with pytest.raises(OllamaUnavailableError):
+            pool.generate(PAYLOAD, timeout=1)
+    assert pool.snapshot()[0]['circuit'] == 'open'
+
+    # After the cooldown a failed probe restarts it
+    clock[0] += ollama_pool.OLLAMA_CIRCUIT_COOLDOWN
+    assert pool.snapshot()[0]['circuit'] == 'half-open'
+    with pytest.raises(OllamaUnavailableError):
+        pool.generate(PAYLOAD, timeout=1)
+    assert pool.snapshot()[0]['circuit'] == 'open'
+
+    # A successful probe closes it
+    clock[0] += ollama_pool.OLLAMA_CIRCUIT_COOLDOWN
+    del behaviours['http://a']
+    assert pool.generate(PAYLOAD, timeout=1) == {'response': 'http://a'}
+    snapshot = pool.snapshot()[0]
+    assert snapshot['circuit'] == 'closed'
+    assert snapshot['consecutive_failures'] == 0
+
+
+def test_open_circuits_are_not_retried_before_cooldown(hosts):
+    behaviours, calls, _ = hosts
+    behaviours['http://a'] = requests.ConnectionError('refused')
+    pool = OllamaPool(['http://a'])
+    for _ in range(OLLAMA_FAILURE_THRESHOLD):
+        with pytest.raises(OllamaUnavailableError):
+            pool.generate(PAYLOAD, timeout=1)
+
+    calls.clear()
+    with pytest.raises(OllamaUnavailableError, match='all circuits open'):
+        pool.generate(PAYLOAD, timeout=1)
+    assert calls == []
+
+
+def test_client_errors_pass_through_without_failover(hosts):
+    behaviours, calls, _ = hosts
+    behaviours['http://a'] = FakeResponse(status_code=404)
+    pool = OllamaPool(['http://a', 'http://b'])
+    pool.hosts[1].avg_latency = 2.0
+
+    for _ in range(OLLAMA_FAILURE_THRESHOLD + 1):
+        with pytest.raises(requests.HTTPError):
+            pool.generate(PAYLOAD, timeout=1)
+    assert calls == ['http://a'] * (OLLAMA_FAILURE_THRESHOLD + 1)
+    assert pool.snapshot()[0]['circuit'] == 'closed'
+    assert pool.hosts[0].total_failures == 0
+    assert pool.hosts[0].in_flight == 0
+
+
+def test_server_errors_count_as_host_failures(hosts):
+    behaviours, calls, _ = hosts
+    behaviours['http://a'] = FakeResponse(status_code=503)
+    pool = OllamaPool(['http://a', 'http://b'])
+    pool.hosts[1].avg_latency = 2.0
+
+    assert pool.generate(PAYLOAD, timeout=1) == {'response': 'http://b'}
+    assert pool.hosts[0].total_failures == 1
+
+
+def test_all_hosts_failing_raises_unavailable(hosts):
+    behaviours, _, _ = hosts
+    behaviours['http://a'] = requests.ConnectionError('refused')
+    behaviours['http://b'] = FakeResponse(status_code=500)
+    pool = OllamaPool(['http://a', 'http://b'])
+    with pytest.raises(OllamaUnavailableError, match='All Ollama hosts failed'):
+        pool.generate(PAYLOAD, timeout=1)
+
+    with pytest.raises(OllamaUnavailableError, match='No Ollama hosts configured'):
+        OllamaPool([]).generate(PAYLOAD, timeout=1)
+
+
+def test_probe_bypasses_circuit_breakers(hosts):
+    behaviours, _, _ = hosts
+    behaviours['http://a'] = requests.ConnectionError('refused')
+    pool = OllamaPool(['http://a', 'http://b'])
+    for _ in range(OLLAMA_FAILURE_THRESHOLD):
+        results = pool.probe(PAYLOAD, timeout=1)
+
+    assert results['http://a']['status'].startswith('error')
+    assert results['http://b'] == {'status': 'ok', 'test_response': 'http://b'}
+    assert [host['circuit'] for host in pool.snapshot()] == ['closed', 'closed']
+    assert pool.hosts[0].total_requests == 0
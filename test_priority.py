@@ -0,0 +1,66 @@
+import priority
+from priority import UidCheckpoint, prioritize, priority_tier
+
+
+def make_email(uid, subject='Hello', from_name='someone', date='Mon, 19 Oct 2026 10:00:00 +0000'):
+    return {'uid': uid, 'subject': subject, 'from_name': from_name, 'from_addr': f'{from_name}@example.com', 'date': date}
+
+
+def test_prioritize_orders_by_sender_then_triage_then_recency(monkeypatch):
+    monkeypatch.setattr(priority, 'PRIORITY_ORDER', ['sender', 'triage', 'recency'])
+    monkeypatch.setattr(priority, 'PRIORITY_SENDERS', {'boss'})
+    monkeypatch.setattr(priority, 'EMAIL_WHITELIST', {'bank'})
+    monkeypatch.setattr(priority, 'EMAIL_BLACKLIST', {'shop'})
+    emails = [
+        make_email(1, 'Weekly newsletter'),
+        make_email(2, 'Big sale', from_name='shop'),
+        make_email(3, 'Lunch?', date='Mon, 19 Oct 2026 09:00:00 +0000'),
+        make_email(4, 'Lunch?', date='Mon, 19 Oct 2026 11:00:00 +0000'),
+        make_email(5, 'URGENT: action required'),
+        make_email(6, 'Statement', from_name='bank'),
+        make_email(7, 'Hi', from_name='boss'),
+    ]
+    assert [email['uid'] for email in prioritize(emails)] == [7, 6, 5, 4, 3, 1, 2]
+
+
+def test_prioritize_breaks_ties_on_newest_uid_and_ignores_unknown_keys(monkeypatch):
+    monkeypatch.setattr(priority, 'PRIORITY_ORDER', ['bogus', 'triage'])
+    emails = [make_email(1), make_email(3), make_email(2), make_email(4, 'Password expires')]
+    assert [email['uid'] for email in prioritize(emails)] == [4, 3, 2, 1]
+
+
+def test_unparseable_dates_sort_as_oldest(monkeypatch):
+    monkeypatch.setattr(priority, 'PRIORITY_ORDER', ['recency'])
+    emails = [make_email(1, date='not a date'), make_email(2, date='Mon, 19 Oct 2026 10:00:00 +0000')]
+    assert [email['uid'] for email in prioritize(emails)] == [2, 1]
+
+
+def test_priority_tier(monkeypatch):
+    monkeypatch.setattr(priority, 'PRIORITY_SENDERS', {'boss'})
+    monkeypatch.setattr(priority, 'EMAIL_BLACKLIST', set())
+    assert priority_tier(make_email(1, from_name='boss')) == 'high'
+    assert priority_tier(make_email(2, 'Overdue invoice')) == 'high'
+    assert priority_tier(make_email(3, 'Lunch?')) == 'normal'
+    assert priority_tier(make_email(4, 'Monthly digest')) == 'low'
+
+
+def test_checkpoint_only_advances_past_contiguous_finished_uids():
+    written = []
+    checkpoint = UidCheckpoint(10, [11, 12, 13, 14], written.append)
+
+    assert checkpoint.mark_done(13) is None
+    assert checkpoint.mark_done(12) is None
+    assert checkpoint.uid == 10
+    assert checkpoint.mark_done(11) == 13
+    assert checkpoint.mark_done(14) == 14
+    assert written == [13, 14]
+
+
+def test_checkpoint_is_held_below_an_unfinished_uid():
+    written = []
+    checkpoint = UidCheckpoint(0, [3, 1, 2], written.append)
+
+    checkpoint.mark_done(1)
+    checkpoint.mark_done(3)
+    assert checkpoint.uid == 1
+    assert written == [1]